@@ -0,0 +1,114 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for the asyncio entry points. Each result is compared against the
+synchronous transduce of the same input.
+"""
+from transducers import *
+from transducers.aio import *
+import asyncio
+import unittest
+from tests.transducer_tests import add, append, fodd, msq
+
+async def arange(n):
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield i
+
+async def agen_series():
+    """Infinite async source, only usable with early termination."""
+    i = 0
+    while True:
+        yield i
+        i += 1
+
+def run(coro):
+    return asyncio.run(coro)
+
+class AsyncTests(unittest.TestCase):
+    def test_atransduce(self):
+        """Sync reducing functions over async iterables."""
+        xform = compose(map(msq), filter(fodd), partition_all(2))
+        self.assertEqual(run(atransduce(xform, append, [], arange(20))),
+                         transduce(xform, append, [], range(20)))
+        self.assertEqual(run(atransduce(map(msq), add, arange(5))), 30)
+        self.assertEqual(run(ainto([], compose(map(msq), take(3)),
+                                   agen_series())),
+                         [0, 1, 4])
+
+    def test_atransduce_async_f(self):
+        """Coroutine reducing functions get every item and the completion,
+        and can stop the reduction themselves."""
+        rows = []
+        async def writer(r=Missing, x=Missing):
+            await asyncio.sleep(0)
+            if r is Missing: return 0
+            if x is Missing:
+                rows.append("done")
+                return r
+            rows.append(x)
+            return Reduced(r + 1) if r + 1 == 3 else r + 1
+        xform = compose(filter(fodd), partition_all(3), take(2))
+        self.assertEqual(run(atransduce(xform, writer, agen_series())), 2)
+        self.assertEqual(rows, [[1, 3, 5], [7, 9, 11], "done"])
+        del rows[:]
+        self.assertEqual(run(atransduce(map(msq), writer, arange(10))), 3)
+        self.assertEqual(rows, [0, 1, 4, "done"])
+
+    def test_atransduce_async_f_reduced(self):
+        """Once the coroutine f returns Reduced, what the transducer's
+        completion flushes is not handed to it, as with transduce."""
+        async def first(r=Missing, x=Missing):
+            if r is Missing: return []
+            if x is Missing: return r
+            r.append(x)
+            return Reduced(r)
+        xform = compose(cat, partition_all(2))
+        self.assertEqual(run(atransduce(xform, first, [], [[1, 2, 3]])),
+                         [[1, 2]])
+
+    def test_map_async(self):
+        """map_async keeps order (unless told not to) and composes with
+        synchronous stages on either side."""
+        async def slow_square(x):
+            await asyncio.sleep((10 - x % 10) / 1000.0)
+            return x * x
+        xform = compose(filter(fodd), map_async(slow_square, concurrency=4),
+                        partition_all(3))
+        self.assertEqual(run(ainto([], xform, range(20))),
+                         transduce(compose(filter(fodd), map(msq),
+                                           partition_all(3)),
+                                   append, [], range(20)))
+        unordered = map_async(slow_square, concurrency=4, ordered=False)
+        self.assertEqual(sorted(run(ainto([], unordered, arange(20)))),
+                         [x * x for x in range(20)])
+
+    def test_map_async_cancels(self):
+        """Work still in flight is cancelled once take is satisfied."""
+        started, cancelled = [], []
+        async def lookup(x):
+            started.append(x)
+            try:
+                await asyncio.sleep(0.001 if x < 3 else 10)
+            except asyncio.CancelledError:
+                cancelled.append(x)
+                raise
+            return x
+        xform = compose(map_async(lookup, concurrency=5), take(3))
+        self.assertEqual(run(ainto([], xform, agen_series())), [0, 1, 2])
+        self.assertEqual(sorted(cancelled), started[3:])
+        self.assertEqual(len(started), 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,85 +11,277 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from transducers import transducers as T
-from tests import genducers as G
-from tests.transducer_tests import append
+"""
+Benchmark suite for transducers.
+
+Run every case at a set of input sizes and write the timings as JSON:
+
+    python -m tests.benchmark run --sizes 1e3,1e4,1e5,1e6 -o before.json
+
+Compare two runs, flagging cases whose median got slower by more than the
+threshold (exit status 1 if any did):
+
+    python -m tests.benchmark compare before.json after.json --threshold 0.05
+
+Each sample times one full transduce (or into) with time.perf_counter_ns and
+the garbage collector disabled, as timeit does, after a few warmup runs.
+Cases are plain (name, make input, run) triples in CASES, so it is easy to
+add more; tests/memory_benchmark.py reuses them. The step/ cases time the
+built-ins' step methods, which the plain single stage cases mostly bypass
+for itertools; the baseline/ cases run the generator based
+tests/genducers.py for comparison.
+"""
+import argparse
+import fnmatch
+import gc
+import json
+import platform
+import sys
 import time
+from collections import deque
+from itertools import count
+
+import transducers as T
+from tests import genducers as G
+
+def flat(n):
+    return list(range(n))
+
+def nested(n, width=100):
+    """n items in total, as lists of width items."""
+    return [list(range(i, min(i + width, n))) for i in range(0, n, width)]
+
+def runs(n, length=5):
+    """n items in runs of equal values, for dedupe and partition_by."""
+    return [i // length for i in range(n)]
+
+def step_append(r=T.Missing, x=T.Missing):
+    """Function-style append. transduce only runs chains through itertools
+    when reducing with T.append, so with this every stage's step runs."""
+    if r is T.Missing: return []
+    if x is T.Missing: return r
+    r.append(x)
+    return r
+step_append.short_circuits = False
+
+def transduce_with(xform):
+    """Case body transducing into a fresh list with the library's append."""
+    return lambda coll: T.transduce(xform, T.append, [], coll)
+
+def stepwise(xform):
+    """Case body stepping every item through xform's reducers: into
+    step_append, and over an iterator of the input so that leading take, drop
+    and take_nth are not turned into slices of it."""
+    return lambda coll: T.transduce(xform, step_append, [], iter(coll))
+
+def into_target(make_target, xform):
+    return lambda coll: T.into(make_target(), xform, coll)
+
+def big_compose(X=T):
+    """The original pipeline, built from X (transducers or genducers)."""
+    return X.compose(X.mapcat(reversed),
+                     X.map(lambda x: x * x),
+                     X.filter(lambda x: x % 2),
+                     X.take_nth(4),
+                     X.dedupe,
+                     X.random_sample(0.70),
+                     X.partition_all(4),
+                     X.take(10 ** 9),
+                     X.mapcat(reversed),
+                     X.drop_while(lambda x: x < 20),
+                     X.remove(lambda x: x % 7),
+                     X.replace({217: 271}),
+                     X.partition_by(lambda x: x < 200))
+
+# (name, input builder, transducer) for the single stage cases. Each runs
+# as is, mostly through itertools, and as step/<name> through the stage's
+# step method (see stepwise).
+STAGES = [
+    ("map", flat, T.map(lambda x: x * x)),
+    ("filter", flat, T.filter(lambda x: x % 2)),
+    ("remove", flat, T.remove(lambda x: x % 4)),
+    ("keep", flat, T.keep(lambda x: x if x % 3 else None)),
+    ("keep_indexed", flat, T.keep_indexed(lambda i, x: i * x if i % 4
+                                          else None)),
+    ("replace", flat, T.replace({0: 1, 100: 200, 1000: 500})),
+    ("cat", nested, T.cat),
+    ("mapcat", nested, T.mapcat(reversed)),
+    ("flatten", nested, T.flatten),
+    ("take", flat, T.take(10 ** 9)),
+    ("take_while", flat, T.take_while(lambda x: x >= 0)),
+    ("drop", flat, T.drop(1000)),
+    ("drop_while", flat, T.drop_while(lambda x: x < 1000)),
+    ("take_nth", flat, T.take_nth(4)),
+    ("dedupe", runs, T.dedupe),
+    ("partition_by", runs, T.partition_by(lambda x: x % 2)),
+    ("partition_all", flat, T.partition_all(10)),
+    ("partition", flat, T.partition(10, 5)),
+    ("sliding", flat, T.sliding(4, tuples=True)),
+    ("random_sample", flat, T.random_sample(0.4)),
+]
+
+# (name, input builder taking the size, case body taking the input)
+CASES = [(name, make_input, transduce_with(xform))
+         for name, make_input, xform in STAGES] + \
+        [("step/" + name, make_input, stepwise(xform))
+         for name, make_input, xform in STAGES] + [
+    ("early/mapcat-take", lambda n: [range(n)] * 2, transduce_with(
+        T.compose(T.mapcat(iter), T.take(10)))),
+    ("sliding/view", flat, transduce_with(
+        T.compose(T.sliding(4, view=True), T.map(sum)))),
+    ("compose/big", nested, transduce_with(big_compose())),
+    ("baseline/genducers-big", nested, lambda coll: G.transduce(
+        big_compose(G), T.append, [], coll)),
+    ("compose/map-filter-map", flat, transduce_with(
+        T.compose(T.map(lambda x: x + 1), T.filter(lambda x: x % 2),
+                  T.map(lambda x: x * 3)))),
+    ("compose/partition", flat, transduce_with(
+        T.compose(T.map(lambda x: x + 1), T.partition_all(8),
+                  T.map(sum)))),
+    ("batch/partition", flat, lambda coll: T.transduce(
+        T.compose(T.map(lambda x: x + 1), T.partition_all(8), T.map(sum)),
+        T.append, [], coll, batch_size=1024)),
+    ("batch/big", nested, lambda coll: T.transduce(
+        big_compose(), T.append, [], coll, batch_size=1024)),
+    ("into/list", flat, into_target(list, T.map(lambda x: x + 1))),
+    ("into/deque", flat, into_target(deque, T.map(lambda x: x + 1))),
+    ("into/list-stateful", flat, into_target(
+        list, T.compose(T.dedupe, T.map(lambda x: x + 1)))),
+    ("early/take-10", flat, transduce_with(
+        T.compose(T.map(lambda x: x * x), T.take(10)))),
+    ("early/take-half", flat, lambda coll: T.transduce(
+        T.compose(T.filter(lambda x: x % 2), T.take(len(coll) // 4)),
+        T.append, [], coll)),
+    ("early/drop-half", flat, lambda coll: T.transduce(
+        T.compose(T.map(lambda x: x + 1), T.drop(len(coll) // 2),
+                  T.partition_all(8)), T.append, [], coll)),
+    ("early/take_while-infinite", lambda n: n, lambda n: T.transduce(
+        T.take_while(lambda x: x < n), T.append, [], count())),
+]
+
+def percentile(samples, q):
+    """Linearly interpolated q-th percentile (0-100) of sorted samples."""
+    pos = (len(samples) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(samples) - 1)
+    return samples[lo] + (samples[hi] - samples[lo]) * (pos - lo)
+
+def measure(run, coll, warmup, repeat, max_time):
+    """Times run(coll) repeat times (fewer once max_time seconds are spent,
+    but never fewer than 3), after warmup untimed runs."""
+    for _ in range(warmup):
+        run(coll)
+    samples = []
+    deadline = time.perf_counter() + max_time
+    while len(samples) < repeat and (len(samples) < 3 or
+                                     time.perf_counter() < deadline):
+        gc.collect()
+        gc.disable()
+        try:
+            t = time.perf_counter_ns()
+            run(coll)
+            samples.append(time.perf_counter_ns() - t)
+        finally:
+            gc.enable()
+    return sorted(samples)
+
+def summarize(name, size, samples):
+    median = percentile(samples, 50)
+    return {"case": name,
+            "size": size,
+            "samples": len(samples),
+            "min_ns": samples[0],
+            "median_ns": median,
+            "mean_ns": sum(samples) / len(samples),
+            "p10_ns": percentile(samples, 10),
+            "p90_ns": percentile(samples, 90),
+            "p99_ns": percentile(samples, 99),
+            "max_ns": samples[-1],
+            "median_ns_per_item": median / size}
+
+def metadata():
+    return {"python": sys.version,
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+def selected(patterns):
+    return [case for case in CASES
+            if not patterns or any(fnmatch.fnmatch(case[0], p)
+                                   for p in patterns)]
+
+def run(args):
+    results = []
+    for size in args.sizes:
+        for name, make_input, body in selected(args.cases):
+            coll = make_input(size)
+            samples = measure(body, coll, args.warmup, args.repeat,
+                              args.max_time)
+            result = summarize(name, size, samples)
+            results.append(result)
+            print("%-28s %9d  median %12.0f ns  p90 %12.0f ns  %8.1f ns/item"
+                  % (name, size, result["median_ns"], result["p90_ns"],
+                     result["median_ns_per_item"]))
+            sys.stdout.flush()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": metadata(), "results": results}, f, indent=2)
+    return 0
+
+def compare(args):
+    """Prints the median ratio (new/old) of every case in both runs and
+    returns 1 if any got slower than the threshold allows."""
+    with open(args.old) as f:
+        old = {(r["case"], r["size"]): r for r in json.load(f)["results"]}
+    with open(args.new) as f:
+        new = {(r["case"], r["size"]): r for r in json.load(f)["results"]}
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        ratio = new[key]["median_ns"] / old[key]["median_ns"]
+        if ratio > 1 + args.threshold:
+            flag = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = "improved"
+        else:
+            flag = ""
+        print("%-28s %9d  %12.0f -> %12.0f ns  x%5.2f  %s"
+              % (key[0], key[1], old[key]["median_ns"], new[key]["median_ns"],
+                 ratio, flag))
+    for key in sorted(set(old) ^ set(new)):
+        print("%-28s %9d  only in %s" % (key[0], key[1],
+                                         args.old if key in old else args.new))
+    print("%d regression(s) over %.0f%%." % (regressions, args.threshold * 100))
+    return 1 if regressions else 0
+
+def sizes(text):
+    return [int(float(size)) for size in text.split(",")]
 
-scale = 10
-
-def run_tests(X):
-    t = time.time()
-    xducer = (X.compose(
-                      X.mapcat(reversed),
-                      X.map(lambda x: x*x),
-                      X.filter(lambda x: x%2),
-                      X.take_nth(4),
-                      X.dedupe,
-                      X.random_sample(0.70),
-                      X.partition_all(4),
-                      X.take(4 * scale**3),
-                      X.mapcat(reversed),
-                      X.drop_while(lambda x: x < 20),
-                      X.remove(lambda x: x%7),
-                      X.replace({217: 271}),
-                      X.partition_by(lambda x: x < 200)
-                         ))
-    X.transduce(xducer,
-              append, [],
-              [range(10000)] * scale)
-    tt = time.time()
-    return tt*1000.0 - t*1000.0
-
-def benchmark_one(X, xduc, input=None, runs=100):
-    """For passing a bunch of transducers in."""
-    if not input:
-        input = range(10000) * scale
-
-    xducer = eval(xduc)
-
-    def test():
-        t = time.time()
-        X.transduce(xducer, append, [], input)
-        tt = time.time()
-        return tt*1000.0 - t*1000.0
-
-    avg = sum([test() for x in range(runs)]) / runs
-    print("Avg. time for " + X.__name__ + " with " + xduc + \
-          " is: " + str(avg))
+def parser():
+    p = argparse.ArgumentParser(prog="python -m tests.benchmark",
+                                description="Transducer benchmarks.")
+    commands = p.add_subparsers(dest="command")
+    commands.required = True
+    r = commands.add_parser("run", help="run the benchmarks")
+    r.add_argument("--sizes", type=sizes, default=sizes("1e3,1e4,1e5,1e6"),
+                   help="comma separated input sizes (up to 1e7)")
+    r.add_argument("--cases", nargs="*", default=[],
+                   help="glob patterns selecting cases, e.g. 'compose/*'")
+    r.add_argument("--warmup", type=int, default=2)
+    r.add_argument("--repeat", type=int, default=25)
+    r.add_argument("--max-time", type=float, default=2.0,
+                   help="seconds to spend on samples of one case and size")
+    r.add_argument("-o", "--output", help="write results as JSON")
+    r.set_defaults(func=run)
+    c = commands.add_parser("compare", help="compare two JSON results")
+    c.add_argument("old")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.05,
+                   help="relative median change counted as a regression")
+    c.set_defaults(func=compare)
+    return p
 
 if __name__ == "__main__":
-    # Define some transducer scenarios. Could comp these through permutations,
-    # if we want to go that route.
-    xducers = {"map(lambda x: x*x)": None,
-               "filter(lambda x: x%2)": None,
-               "take(10000)": None,
-               "partition_by(lambda x: x%2)": range(100) * scale,
-               "partition_all(10)": range(1000) * scale,
-               "mapcat(reversed)": [range(1000)] * scale,
-               "cat": [range(1000)] * scale,
-               "take_while(lambda x: x < 1000)": None,
-               "remove(lambda x: x % 4)": None,
-               "drop(1000)": None,
-               "drop_while(lambda x: x < 1500)": None,
-               "take_nth(4)": None,
-               "replace({0:1, 100:200, 1000:500})": None,
-               "keep(lambda x: x if x > 100 else None)": None,
-               "keep_indexed(lambda i, x: i*x if i%4 else None)": None,
-               "dedupe": [1,1,1, 3,3,3, 2,4,2,4, 1,1,1] * scale*scale,
-               "random_sample(0.4)": None}
-
-    # Run benchmarks for whole set of transducers per tranducer
-    for xduc, input in xducers.items():
-        benchmark_one(T, "T."+xduc, input)
-        benchmark_one(G, "G."+xduc, input)
-
-    # Keep test for big compose for now...
-    runs = 100
-    T_deltas = [run_tests(T) for x in range(runs)]
-    G_deltas = [run_tests(G) for x in range(runs)]
-    T_mean = sum(T_deltas) / runs
-    G_mean = sum(G_deltas) / runs
-
-    print("Average for large compose for Generators: " + str(G_mean) + " ms.")
-    print("Average for large compose for Transducers: " + str(T_mean) + " ms.")
+    args = parser().parse_args()
+    sys.exit(args.func(args))
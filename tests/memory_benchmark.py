@@ -0,0 +1,127 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Memory benchmarks for transducers, using the cases in tests/benchmark.py.
+
+    python -m tests.memory_benchmark --sizes 1e5,1e6 -o memory.json
+
+Each case and size runs once in a fresh process under tracemalloc, with the
+input built before tracing starts. It reports:
+
+  peak      highest traced memory while the case runs, in bytes per input
+            element; this includes the result being built
+  retained  traced memory still held when the case returns (mostly the
+            result), in bytes and blocks per input element
+  leaked    traced memory still held after the result is dropped and
+            garbage collected
+  max rss   the child's peak resident set size, input included
+
+tracemalloc only sees live blocks, so short lived garbage (a buffer copied
+and freed on every emission) shows up in the peak only as far as it
+overlaps, never as a total allocation count. Time the same cases with
+tests/benchmark.py to see what that churn costs.
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import sys
+import tracemalloc
+
+from tests import benchmark
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def max_rss():
+    """Peak resident set size of this process in bytes, or None."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+def measure(name, size):
+    """Runs one case under tracemalloc; meant to run in its own process."""
+    make_input, body = dict((c[0], c[1:]) for c in benchmark.CASES)[name]
+    coll = make_input(size)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = body(coll)
+        current, peak = tracemalloc.get_traced_memory()
+        current, peak = current - baseline, peak - baseline
+        stats = tracemalloc.take_snapshot().compare_to(before, "filename")
+        blocks = sum(s.count_diff for s in stats)
+        del result, stats
+        gc.collect()
+        leaked = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return {"case": name,
+            "size": size,
+            "peak_bytes": peak,
+            "retained_bytes": current,
+            "retained_blocks": blocks,
+            "leaked_bytes": leaked,
+            "max_rss_bytes": max_rss(),
+            "peak_bytes_per_item": peak / size,
+            "retained_bytes_per_item": current / size,
+            "retained_blocks_per_item": blocks / size}
+
+def isolated(name, size, context):
+    pool = context.Pool(1)
+    try:
+        return pool.apply(measure, (name, size))
+    finally:
+        pool.close()
+        pool.join()
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m tests.memory_benchmark",
+                                description="Transducer memory benchmarks.")
+    p.add_argument("--sizes", type=benchmark.sizes,
+                   default=benchmark.sizes("1e4,1e5,1e6"),
+                   help="comma separated input sizes (up to 1e7)")
+    p.add_argument("--cases", nargs="*", default=[],
+                   help="glob patterns selecting cases, e.g. 'partition*'")
+    p.add_argument("-o", "--output", help="write results as JSON")
+    args = p.parse_args(argv)
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in args.sizes:
+        for case in benchmark.selected(args.cases):
+            result = isolated(case[0], size, context)
+            results.append(result)
+            rss = result["max_rss_bytes"]
+            print("%-28s %9d  peak %8.1f B/item  retained %8.1f B/item "
+                  "%6.2f blocks/item  leaked %8d B  max rss %s"
+                  % (case[0], size, result["peak_bytes_per_item"],
+                     result["retained_bytes_per_item"],
+                     result["retained_blocks_per_item"],
+                     result["leaked_bytes"],
+                     "n/a" if rss is None else "%.1f MiB" % (rss / 2.0 ** 20)))
+            sys.stdout.flush()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": benchmark.metadata(), "results": results}, f,
+                      indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
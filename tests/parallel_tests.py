@@ -0,0 +1,163 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for the parallel runners. Results are always compared against a plain
+serial transduce of the same input.
+"""
+from transducers import *
+from transducers.parallel import *
+import multiprocessing
+import operator
+import time
+import unittest
+from array import array
+from tests.transducer_tests import add, append, fodd, msq, geometric_series
+
+def concat(a=Missing, b=Missing):
+    if a is Missing: return []
+    if b is Missing: return a
+    return a + b
+
+def divmod_by_3(x):
+    return divmod(x, 3)
+
+class ParallelTests(unittest.TestCase):
+    def test_fold(self):
+        """Folding stateless stages should match a serial transduce."""
+        xform = compose(map(msq), filter(fodd), mapcat(lambda x: [x, -x]))
+        self.assertEqual(fold(xform, add, add, range(10000), n=1000),
+                         transduce(xform, add, 0, range(10000)))
+        self.assertEqual(fold(xform, append, concat, list(range(1000)), n=100),
+                         transduce(xform, append, [], range(1000)))
+
+    def test_fold_serial_fallback(self):
+        """Stateful stages must not be split across chunks."""
+        xform = compose(map(msq), partition_all(3), take(4))
+        self.assertEqual(fold(xform, append, concat, list(range(1000)), n=10),
+                         [[0, 1, 4], [9, 16, 25], [36, 49, 64], [81, 100, 121]])
+
+    def test_fold_shared_memory(self):
+        """Numeric arrays are shipped through shared memory."""
+        xform = compose(filter(fodd), map(msq))
+        data = array("q", range(5000))
+        self.assertEqual(fold(xform, add, add, data, n=512),
+                         transduce(xform, add, 0, range(5000)))
+        self.assertEqual(fold(xform, add, add, list(range(5000)), n=512,
+                              shared=False),
+                         transduce(xform, add, 0, range(5000)))
+        text = array("u", "ab" * 1000)
+        self.assertEqual(fold(map(str.upper), append, concat, text, n=100),
+                         ["A", "B"] * 1000)
+        self.assertRaises(ValueError, fold, map(str.upper), append, concat,
+                          text, n=100, shared=True)
+
+    def test_thread_fold(self):
+        """Thread folds should match a serial transduce, with or without the
+        GIL."""
+        xform = compose(map(msq), filter(fodd), mapcat(lambda x: [x, -x]))
+        expected = transduce(xform, append, [], range(1000))
+        self.assertEqual(thread_fold(xform, append, concat, range(1000), n=64),
+                         expected)
+        self.assertEqual(thread_fold(xform, append, concat, range(1000), n=64,
+                                     workers=4, force=True),
+                         expected)
+        self.assertEqual(thread_fold(compose(xform, dedupe), append, concat,
+                                     range(1000), n=64, force=True),
+                         expected)
+
+    def test_pmap(self):
+        """pmap should match map, in order unless asked otherwise."""
+        xform = compose(filter(fodd), pmap(msq, workers=3), partition_all(4))
+        self.assertEqual(transduce(xform, append, [], range(50)),
+                         transduce(compose(filter(fodd), map(msq),
+                                           partition_all(4)),
+                                   append, [], range(50)))
+        self.assertEqual(sorted(into([], pmap(msq, ordered=False), range(50))),
+                         [x * x for x in range(50)])
+
+    def test_pmap_bounded(self):
+        """pmap only runs ahead of downstream by its window, and stops
+        submitting once downstream is done."""
+        calls = []
+        def record(x):
+            calls.append(x)
+            return x
+        xform = compose(pmap(record, workers=2, prefetch=3), take(10))
+        self.assertEqual(transduce(xform, append, [], geometric_series(1, 1)),
+                         [1] * 10)
+        self.assertTrue(len(calls) <= 10 + 5)
+
+    def test_pmap_downstream_failure(self):
+        """Pending calls are cancelled when a later stage raises."""
+        calls = []
+        def slow(x):
+            time.sleep(0.01)
+            calls.append(x)
+            return x
+        def bad(x):
+            raise ValueError(x)
+        xform = compose(pmap(slow, workers=2, prefetch=50), map(bad))
+        self.assertRaises(ValueError, transduce, xform, append, [],
+                          range(100))
+        time.sleep(0.3)
+        self.assertTrue(len(calls) < 10)
+
+    def test_pipeline_parallel(self):
+        """Stages in separate processes keep order and completion."""
+        parse = compose(map(msq), partition_by(lambda x: x % 3 == 0))
+        score = compose(map(len), dedupe, partition_all(4))
+        expected = transduce(compose(parse, score), append, [], range(2000))
+        self.assertEqual(transduce(pipeline_parallel(parse, score,
+                                                     batch_size=16,
+                                                     queue_size=2),
+                                   append, [], range(2000)),
+                         expected)
+
+    def test_pipeline_parallel_early_termination(self):
+        """Stopping inside a stage, or downstream, ends the pipeline, even
+        over infinite input."""
+        xform = pipeline_parallel(map(msq), compose(filter(fodd), take(5)),
+                                  batch_size=8)
+        self.assertEqual(transduce(xform, append, [], geometric_series(1, 1)),
+                         [1] * 5)
+        xform = compose(pipeline_parallel(map(msq), batch_size=4), take(3))
+        self.assertEqual(transduce(xform, append, [], geometric_series(1, 2)),
+                         [1, 4, 16])
+
+    def test_pipeline_parallel_failure(self):
+        """Errors in a stage surface in the calling process."""
+        xform = pipeline_parallel(map(lambda x: 1 // (x - 3)))
+        self.assertRaises(RuntimeError, transduce, xform, append, [], range(10))
+        def bad(x):
+            raise ValueError(x)
+        before = len(multiprocessing.active_children())
+        self.assertRaises(ValueError, into, [],
+                          compose(pipeline_parallel(map(abs)), map(bad)),
+                          range(100))
+        self.assertEqual(len(multiprocessing.active_children()), before)
+
+    def test_spawn(self):
+        """Picklable pipelines run in spawned workers too."""
+        xform = compose(map(operator.neg), filter(operator.truth),
+                        mapcat(divmod_by_3))
+        self.assertEqual(fold(xform, append, concat, list(range(600)), n=200,
+                              workers=2, start_method="spawn"),
+                         transduce(xform, append, [], range(600)))
+        xform = pipeline_parallel(compose(map(operator.neg), partition_all(3)),
+                                  start_method="spawn")
+        self.assertEqual(transduce(xform, append, [], range(10)),
+                         [[0, -1, -2], [-3, -4, -5], [-6, -7, -8], [-9]])
+
+if __name__ == "__main__":
+    unittest.main()
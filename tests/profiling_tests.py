@@ -0,0 +1,58 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for per-stage profiling.
+"""
+from transducers import *
+import transducers
+import unittest
+from tests.transducer_tests import append, fodd, msq
+
+class ProfilingTests(unittest.TestCase):
+    def test_profile(self):
+        """Counts in and out of every stage; the result is unchanged."""
+        xform = compose(map(msq), filter(fodd), partition_all(3), take(2))
+        profiled = profile(xform)
+        self.assertEqual(transduce(profiled, append, [], range(100)),
+                         transduce(xform, append, [], range(100)))
+        report = profiled.report()
+        self.assertEqual([(r["stage"], r["in"], r["out"]) for r in report.rows],
+                         [("map(<lambda>)", 12, 12),
+                          ("filter(<lambda>)", 12, 6),
+                          ("partition_all(3)", 6, 2), ("take(2)", 2, 2),
+                          ("append", 2, None)])
+        self.assertEqual(report.rows[1]["selectivity"], 0.5)
+        self.assertEqual(sum(r["self_ns"] for r in report.rows),
+                         report.total_ns)
+        self.assertEqual(report.as_dict()["stages"], report.rows)
+        self.assertIn("partition_all(3)", str(report))
+
+    def test_profile_lowerable(self):
+        """Chains that transduce and into would otherwise run through
+        itertools are still instrumented."""
+        xform = compose(map(msq), filter(fodd))
+        profiled = profile(xform)
+        self.assertEqual(transduce(profiled, transducers.append, [],
+                                   range(10)), [1, 9, 25, 49, 81])
+        self.assertEqual([(r["in"], r["out"]) for r in profiled.report().rows],
+                         [(10, 10), (10, 5), (5, None)])
+        self.assertEqual(into([], profiled, range(4)), [1, 9])
+        self.assertEqual(profiled.report().rows[0]["in"], 4)
+
+    def test_profile_unused(self):
+        """No report before the transducer has run."""
+        self.assertRaises(ValueError, profile(map(msq)).report)
+
+if __name__ == "__main__":
+    unittest.main()
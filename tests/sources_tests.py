@@ -0,0 +1,84 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for the bulk file sources. Small chunk sizes make lines and records
+straddle chunk boundaries.
+"""
+from transducers import *
+from transducers import sources
+import os
+import tempfile
+import unittest
+from tests.transducer_tests import append
+
+TEXT = u"alpha\n\nbeta gamma\ndéjà vu\n" + u"x" * 20 + u"\nlast"
+
+class SourcesTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            f.write(TEXT.encode("utf-8"))
+        self.opened = []
+        def spying_open(*args):
+            f = open(*args)
+            self.opened.append(f)
+            return f
+        sources.open = spying_open
+
+    def tearDown(self):
+        del sources.open
+        os.remove(self.path)
+
+    def test_lines(self):
+        """Lines match splitting the decoded text, whatever the chunking."""
+        expected = TEXT.split(u"\n")
+        for chunk_size in (1, 3, 7, 1 << 20):
+            for mmap in (False, True):
+                source = lines(self.path, chunk_size=chunk_size, mmap=mmap)
+                self.assertEqual(list(source), expected)
+                self.assertEqual(into([], map(len), source),
+                                 [len(l) for l in expected])
+                views = lines(self.path, chunk_size=chunk_size, mmap=mmap,
+                              view=True)
+                self.assertEqual([bytes(v).decode("utf-8") for v in views],
+                                 expected)
+        self.assertTrue(all(f.closed for f in self.opened))
+
+    def test_records(self):
+        """Fixed size records, the last one shorter."""
+        data = TEXT.encode("utf-8")
+        expected = [data[i:i + 4] for i in range(0, len(data), 4)]
+        for chunk_size in (1, 6, 1 << 20):
+            for mmap in (False, True):
+                for view in (False, True):
+                    self.assertEqual(
+                        [bytes(r) for r in records(self.path, 4, chunk_size,
+                                                   mmap, view)], expected)
+        self.assertRaises(ValueError, records, self.path, 0)
+
+    def test_early_termination(self):
+        """The file is closed as soon as the reduction or iteration stops."""
+        self.assertEqual(transduce(take(2), append, [],
+                                   lines(self.path, chunk_size=4)),
+                         ["alpha", ""])
+        self.assertTrue(self.opened[-1].closed)
+        it = iter(eduction(compose(take(3), partition_all(2)),
+                           records(self.path, 2, chunk_size=2)))
+        self.assertEqual(next(it), [b"al", b"ph"])
+        self.assertFalse(self.opened[-1].closed)
+        self.assertEqual(next(it), [b"a\n"])
+        self.assertTrue(self.opened[-1].closed)
+
+if __name__ == "__main__":
+    unittest.main()
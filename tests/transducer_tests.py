@@ -27,9 +27,18 @@ If it doesn't pass all three, don't commit changes unless you _really_ know
 what you are doing!
 """
 from transducers import *
+from transducers.transducers import _stages
+import transducers
+import array
+import pickle
+import tracemalloc
 import unittest
 from collections import deque
 from fractions import Fraction
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # helping reducers
 def add(r=Missing, x=Missing):
@@ -90,6 +99,21 @@ def alternating_transducer(step):
         return step(r, sign*x)
     return alternate
 
+class Doubling(Transducer):
+    """Class-based transducer: emits each item twice, then the item count on
+    completion."""
+    __slots__ = ("count",)
+    def __init__(self, rf):
+        Transducer.__init__(self, rf)
+        self.count = 0
+
+    def step(self, r, x):
+        self.count += 1
+        return self.rf_step(self.rf_step(r, x), x)
+
+    def complete(self, r):
+        return self.rf.complete(self.rf_step(r, self.count))
+
 class TransducerTests(unittest.TestCase):
     """
     These tests verify that Python tranducers return same or best match avail.
@@ -359,6 +383,374 @@ class TransducerTests(unittest.TestCase):
         self.assertEqual(next(gsrs), 32)
         pass
 
+    def test_compile_xform(self):
+        """Fused stateless runs should give the same results as the unfused
+        chain, including around stateful stages and early termination."""
+        xform = compose(map(msq),
+                        filter(fodd),
+                        replace({9: "nine"}),
+                        partition_all(2),
+                        mapcat(reversed),
+                        keep(lambda x: None if x == 25 else x),
+                        remove(lambda x: x == 49),
+                        take(6))
+        compiled = compile_xform(xform)
+        self.assertEqual(len(compiled.stages), 6)
+        self.assertEqual(transduce(compiled, append, [], range(30)),
+                         transduce(xform, append, [], range(30)))
+        self.assertEqual(transduce(compile_xform(map(msq)), append, [], range(3)),
+                         [0, 1, 4])
+
+    def test_transducer_class(self):
+        """Class-based and function-style transducers should compose in
+        either order."""
+        self.assertEqual(transduce(compose(take(3), Doubling, alternating_transducer),
+                                   append, [], range(10)),
+                         [0, 0, 1, -1, 2, -2, 3])
+        self.assertEqual(transduce(compose(alternating_transducer, Doubling),
+                                   append, [], range(1, 4)),
+                         [1, 1, -2, -2, 3, 3])
+
+    def test_completion_after_flush(self):
+        """Completion should reach downstream stages even when there is
+        nothing left to flush."""
+        self.assertEqual(transduce(compose(partition_all(3), partition_all(2)),
+                                   append, [], range(3)),
+                         [[[0, 1, 2]]])
+
+    def test_no_short_circuit_loop(self):
+        """Chains that cannot short circuit skip the Reduced check, but a
+        reducing function that can must still stop the reduction."""
+        def add_until_100(r=Missing, x=Missing):
+            if r is Missing: return 0
+            if x is Missing: return r
+            return Reduced(r + x) if r + x >= 100 else r + x
+        xform = compose(map(msq), filter(fodd), partition_all(2), map(sum))
+        self.assertEqual(transduce(xform, add_until_100, 0, range(100)), 286)
+        self.assertEqual(transduce(xform, add, 0, range(10)), 165)
+
+    def test_bulk_append(self):
+        """Transducing into the library's append extends the target in bulk
+        when the chain lowers to iterators, and reduces otherwise."""
+        target = [-1]
+        self.assertTrue(transduce(compose(map(msq), filter(fodd)),
+                                  transducers.append, target, range(6))
+                        is target)
+        self.assertEqual(target, [-1, 1, 9, 25])
+        self.assertEqual(transduce(compose(map(msq), partition_all(2)),
+                                   transducers.append, [], range(3)),
+                         [[0, 1], [4]])
+
+    def test_into_targets(self):
+        """into fills sets, dicts, strings, deques and arrays, by bulk update
+        or step by step."""
+        self.assertEqual(into({0}, map(msq), range(4)), {0, 1, 4, 9})
+        self.assertEqual(into(set(), compose(dedupe, random_sample(1.0)),
+                              [1, 1, 2]), {1, 2})
+        self.assertEqual(into({}, map(lambda x: (x, msq(x))), range(3)),
+                         {0: 0, 1: 1, 2: 4})
+        self.assertEqual(into({"a": 9}, compose(partition_all(2), map(tuple)),
+                              ["a", 1, "b", 2]), {"a": 1, "b": 2})
+        self.assertEqual(into("x", map(str.upper), "abc"), "xABC")
+        self.assertEqual(into("", compose(partition_all(2), map("-".join)),
+                              "abc"), "a-bc")
+        self.assertEqual(into(deque([0]), filter(fodd), range(4)),
+                         deque([0, 1, 3]))
+        self.assertEqual(into(bytearray(b"a"), map(ord), "bc"),
+                         bytearray(b"abc"))
+        self.assertEqual(into(array.array("i"), take(2), range(5)),
+                         array.array("i", [0, 1]))
+
+    def test_size_hint(self):
+        """Stages carry the input count through, exactly or as a bound."""
+        self.assertEqual(size_hint(compose(map(msq), replace({})), range(7)),
+                         (7, True))
+        self.assertEqual(size_hint(compose(drop(1), partition_all(2)),
+                                   range(7)), (3, True))
+        self.assertEqual(size_hint(compose(filter(fodd), take(2)), range(7)),
+                         (2, False))
+        self.assertEqual(size_hint(take(3), geometric_series(1, 2)),
+                         (None, False))
+        self.assertEqual(size_hint(cat, [[1], [2]]), (None, False))
+        self.assertEqual(size_hint(compile_xform(compose(map(msq), take_nth(3),
+                                                         map(msq))), range(7)),
+                         (3, True))
+        Doubling.size_hint = staticmethod(lambda n, exact: (2 * n, exact))
+        try:
+            self.assertEqual(size_hint(Doubling, iter(range(4))), (8, False))
+        finally:
+            del Doubling.size_hint
+        target = [-1]
+        self.assertTrue(into(target, map(msq), range(4)) is target)
+        self.assertEqual(target, [-1, 0, 1, 4, 9])
+
+    def test_into_bounds_not_preallocated(self):
+        """Upper bounds on the count are not taken as list sizes."""
+        self.assertEqual(into([], take(10 ** 9), (x for x in range(5))),
+                         [0, 1, 2, 3, 4])
+        tracemalloc.start()
+        try:
+            self.assertEqual(into([], filter(lambda x: x == 5),
+                                  range(10 ** 6)), [5])
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 10 ** 5)
+
+    def test_into_overflowing_length(self):
+        """Inputs too long for len() have no known count."""
+        self.assertEqual(size_hint(map(msq), range(10 ** 20)), (None, False))
+        self.assertEqual(into([], take_while(lambda x: x < 3),
+                              range(10 ** 20)), [0, 1, 2])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_into_ndarray(self):
+        """into a numpy array returns a new, longer array."""
+        target = numpy.arange(3)
+        self.assertEqual(into(target, map(msq), range(4)).tolist(),
+                         [0, 1, 2, 0, 1, 4, 9])
+        self.assertEqual(into(target, compose(filter(fodd), partition_all(1),
+                                              cat), range(4)).tolist(),
+                         [0, 1, 2, 1, 3])
+        self.assertEqual(target.tolist(), [0, 1, 2])
+
+    def test_batch_size(self):
+        """Batched transduction gives the element-wise results, including
+        early termination and completion, whatever the batch boundaries."""
+        xforms = [compose(map(msq), filter(fodd), remove(lambda x: x % 3 == 0)),
+                  compose(keep(onlyeven), replace({4: -4}), take_nth(3)),
+                  compose(drop(5), take(7), partition_all(3)),
+                  compose(partition_all(4), take(2)),
+                  compose(partition_all(3), take_while(lambda p: p[0] < 9)),
+                  compose(drop_while(lambda x: x < 6), take_while(
+                      lambda x: x < 20), keep_indexed(onlyeven_idx)),
+                  compose(mapcat(lambda x: [x] * (x % 3)), dedupe,
+                          partition_by(fodd), take(4)),
+                  compose(take(0), map(msq)),
+                  compose(Doubling, partition_all(4)),
+                  compile_xform(compose(map(msq), filter(fodd), take(4)))]
+        for xform in xforms:
+            expected = transduce(xform, append, [], range(30))
+            for batch_size in (1, 2, 7, 64):
+                self.assertEqual(transduce(xform, append, [], range(30),
+                                           batch_size=batch_size), expected)
+                self.assertEqual(transduce(xform, transducers.append, [],
+                                           iter(range(30)),
+                                           batch_size=batch_size), expected)
+        self.assertEqual(into([], take(3), geometric_series(1, 2),
+                              batch_size=2), [1, 2, 4])
+
+    def test_partitions(self):
+        """Partitions are handed off without copies, or as tuples; partition
+        and sliding give fixed size windows every step items."""
+        self.assertEqual(transduce(partition_all(3, tuples=True), append, [],
+                                   range(8)), [(0, 1, 2), (3, 4, 5), (6, 7)])
+        self.assertEqual(transduce(partition_all(3, tuples=True), append, [],
+                                   range(8), batch_size=5),
+                         [(0, 1, 2), (3, 4, 5), (6, 7)])
+        parts = transduce(partition_all(2), append, [], range(4))
+        self.assertFalse(parts[0] is parts[1])
+        for f in (append, transducers.append):
+            self.assertEqual(transduce(partition_by(fodd, tuples=True), f, [],
+                                       [1, 3, 2, 5]), [(1, 3), (2,), (5,)])
+        self.assertEqual(transduce(partition(3), append, [], range(8)),
+                         [[0, 1, 2], [3, 4, 5]])
+        self.assertEqual(transduce(partition(2, 3, tuples=True), append, [],
+                                   range(8)), [(0, 1), (3, 4), (6, 7)])
+        self.assertEqual(transduce(sliding(3), append, [], range(5)),
+                         [[0, 1, 2], [1, 2, 3], [2, 3, 4]])
+        self.assertEqual(transduce(compose(sliding(2, view=True), map(sum)),
+                                   append, [], range(5)), [1, 3, 5, 7])
+        self.assertEqual(size_hint(partition(3, 2), range(8)), (3, True))
+        self.assertEqual(size_hint(sliding(9), range(8)), (0, True))
+        self.assertEqual(pickle.loads(pickle.dumps(sliding(2, True))).stage,
+                         ("partition", 2, 1, True, False))
+        self.assertRaises(ValueError, partition, 0)
+
+    def test_cat_early_termination(self):
+        """cat and mapcat stop walking an inner collection once downstream
+        is done, and stop the outer reduction too."""
+        pulled = []
+        def inner(n):
+            for i in range(n):
+                pulled.append(i)
+                yield i
+        for xform in (compose(map(inner), cat, take(3)),
+                      compose(mapcat(inner), take(3))):
+            del pulled[:]
+            self.assertEqual(transduce(xform, append, [], [10 ** 6, 10 ** 6]),
+                             [0, 1, 2])
+            self.assertEqual(pulled, [0, 1, 2])
+        gsrs = geometric_series(1, 2)
+        self.assertEqual(transduce(compose(map(lambda x: [x, x]), cat,
+                                           take(3)), add, 0, gsrs), 1 + 1 + 2)
+        self.assertEqual(next(gsrs), 4)
+
+    def test_flatten(self):
+        """flatten walks nested iterables at any depth, keeping strings whole,
+        without recursing and stopping early when downstream is done."""
+        self.assertEqual(transduce(flatten, append, [],
+                                   [1, [2, (3, [4, []])], "ab", {"k": 1},
+                                    iter([5, b"c"])]),
+                         [1, 2, 3, 4, "ab", {"k": 1}, 5, b"c"])
+        deep = [7]
+        for _ in range(10000):
+            deep = [deep]
+        self.assertEqual(transduce(flatten, append, [], [deep, deep]), [7, 7])
+        self.assertEqual(transduce(compose(flatten, take(4)), append, [],
+                                   [[0, [geometric_series(1, 2)]]]),
+                         [0, 1, 2, 4])
+
+    def test_coll_reduce(self):
+        """Collections reducing themselves, through __transduce_reduce__ or
+        the coll_reduce registry, are used by reduce, transduce and into."""
+        class Chunked(object):
+            def __init__(self, n):
+                self.n, self.chunks = n, 0
+            def __iter__(self):
+                raise AssertionError("iterated instead of reduced")
+            def __transduce_reduce__(self, rf, init):
+                r = init
+                for i in range(0, self.n, 4):
+                    self.chunks += 1
+                    r = rf.step_many(r, list(range(i, min(i + 4, self.n))))
+                    if isinstance(r, Reduced):
+                        return r.val
+                return r
+        self.assertEqual(reduce(add, Chunked(10)), 45)
+        self.assertEqual(into([], compose(map(msq), partition_all(3)),
+                              Chunked(7)), [[0, 1, 4], [9, 16, 25], [36]])
+        source = Chunked(10 ** 6)
+        self.assertEqual(transduce(take(5), append, [], source), list(range(5)))
+        self.assertEqual(source.chunks, 2)
+        class Countdown(object):
+            def __init__(self, n):
+                self.n = n
+        @coll_reduce.register(Countdown)
+        def _(coll, rf, init):
+            return reduce(rf, range(coll.n, 0, -1), init)
+        self.assertEqual(into([], filter(fodd), Countdown(6)), [5, 3, 1])
+
+    def test_eduction_reduces_itself(self):
+        """Eductions reduce straight into the outer reducer, completing their
+        own transducer but leaving the outer one to the caller."""
+        ed = eduction(compose(filter(fodd), partition_all(2)), range(10))
+        self.assertEqual(transduce(map(sum), append, [], ed), [4, 12, 9])
+        self.assertEqual(into([], compose(cat, take(3)), ed), [1, 3, 5])
+        self.assertEqual(transduce(partition_all(2), append, [],
+                                   eduction(map(msq), range(3))),
+                         [[0, 1], [4]])
+        ed = eduction(alternating_transducer, [1, 2, 3])
+        self.assertEqual(into([], map(msq), ed), [1, 4, 9])
+        self.assertEqual(transduce(map(abs), append, [], ed), [1, 2, 3])
+        self.assertEqual(list(ed), [1, -2, 3])
+
+    def test_slice_push_down(self):
+        """Leading drop/take/take_nth over sequences become slices, with the
+        same results as stepping through every item."""
+        xforms = [compose(drop(5), take(7)),
+                  compose(map(msq), take_nth(3), drop(2), take(4),
+                          partition_all(3)),
+                  compose(replace({9: -9}), drop(-1), take_nth(2),
+                          filter(fodd)),
+                  compose(take(0), map(msq)),
+                  compose(take(100), drop(90)),
+                  compile_xform(compose(map(msq), map(msq), drop(25))),
+                  drop(3)]
+        for xform in xforms:
+            expected = transduce(xform, append, [], iter(range(30)))
+            for coll in (list(range(30)), tuple(range(30)), range(30),
+                         deque(range(30))):
+                self.assertEqual(transduce(xform, append, [], coll), expected)
+                self.assertEqual(into([], xform, coll), expected)
+        self.assertEqual(into("", compose(drop(1), take_nth(2)), "abcdef"),
+                         "bdf")
+        seen = []
+        def spy(x):
+            seen.append(x)
+            return x
+        self.assertEqual(transduce(compose(map(spy), drop(10 ** 6)), add, 0,
+                                   range(10 ** 6 + 2)), 2 * 10 ** 6 + 1)
+        self.assertEqual(seen, [10 ** 6, 10 ** 6 + 1])
+        big = list(range(10 ** 6))
+        self.assertEqual(into([], compose(drop(1), take_nth(2)), deque(big))
+                         [-1], 10 ** 6 - 1)
+        tracemalloc.start()
+        try:
+            self.assertEqual(transduce(compose(drop(1), filter(lambda x: 0)),
+                                       append, [], big), [])
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 10 ** 5) # <-- no copy of big.
+        huge = range(10 ** 20)
+        self.assertEqual(transduce(take(3), append, [], huge), [0, 1, 2])
+        self.assertEqual(transduce(compose(drop(5), take_nth(2), take(3)),
+                                   transducers.append, [], huge), [5, 7, 9])
+
+    def test_eduction(self):
+        """Eductions are lazy, re-iterable and flush on completion."""
+        gsrs = geometric_series(1, 2)
+        ed = eduction(compose(map(msq), partition_all(2), take(3)), gsrs)
+        it = iter(ed)
+        self.assertEqual(next(it), [1, 4])
+        self.assertEqual(next(gsrs), 4)
+        self.assertEqual(list(it), [[64, 256], [1024, 4096]])
+        ed = eduction(compose(filter(fodd), partition_all(3)), range(10))
+        self.assertEqual(list(ed), [[1, 3, 5], [7, 9]])
+        self.assertEqual(list(ed), [[1, 3, 5], [7, 9]])
+
+    def test_transducing(self):
+        """A push sink keeps transducer state across sends and flushes."""
+        sink = Transducing(compose(dedupe, partition_all(3)), append, [])
+        sink.send(1)
+        sink.send(1)
+        sink.send_many([2, 2, 3, 4])
+        self.assertEqual(sink.flush(), [[1, 2, 3]])
+        sink.send_many([4, 4, 5])
+        self.assertEqual(sink.flush(), [])
+        self.assertEqual(sink.close(), [[4, 5]])
+        self.assertRaises(ValueError, sink.send, 6)
+        with Transducing(compose(map(msq), take(2)), append) as sink:
+            sink.send_many(geometric_series(1, 2))
+            self.assertTrue(sink.is_done)
+            sink.send(10)
+        self.assertEqual(sink.close(), [1, 4])
+
+    def test_pickle(self):
+        """Built-in transducers and compositions of them pickle, and unpickle
+        to fresh pipelines giving the same results."""
+        xform = compose(map(abs), filter(bool), replace({3: 33}),
+                        partition_all(2), mapcat(reversed), dedupe, take(5))
+        for xf in (xform, compile_xform(xform)):
+            copy = pickle.loads(pickle.dumps(xf))
+            self.assertEqual(transduce(copy, append, [], range(-10, 10)),
+                             transduce(xf, append, [], range(-10, 10)))
+        self.assertEqual(_stages(pickle.loads(pickle.dumps(xform)))[0].stage,
+                         ("map", abs))
+
+    def test_itertools_engine(self):
+        """The itertools engine should match the reducer path, whether the
+        chain lowers to iterators or falls back."""
+        lowered = compose(drop_while(lambda x: x < 3),
+                          mapcat(lambda x: [x, x]),
+                          dedupe,
+                          keep_indexed(lambda i, x: x if i%3 else None),
+                          replace({4: "four"}),
+                          partition_by(lambda x: x == "four"),
+                          take_nth(2),
+                          take(4))
+        fallback = compose(map(msq), partition_all(3))
+        for xform in (lowered, fallback, compile_xform(lowered)):
+            self.assertEqual(transduce(xform, append, [], range(40),
+                                       engine="itertools"),
+                             transduce(xform, append, [], range(40)))
+        gsrs = geometric_series(1, 2)
+        self.assertEqual(into([], compose(map(msq), take(5)), gsrs,
+                              engine="itertools"),
+                         [1, 4, 16, 64, 256])
+        self.assertEqual(next(gsrs), 32)
+
 # Verbose tests to verify transducer correctness
 if __name__ == "__main__":
     unittest.main()
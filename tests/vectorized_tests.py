@@ -0,0 +1,101 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Tests for the NumPy block transducers. Each result is compared against the
+scalar transducers over the same input, with small blocks so that stages
+see items spread over several of them.
+"""
+from transducers import *
+from transducers import vectorized as V
+from transducers.transducers import _kind, _stages
+import pickle
+import unittest
+from tests.transducer_tests import fodd, msq
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def blocks(n, size):
+    """Iterable of blocks that fails if pulled from past n items."""
+    for i in range(0, n, size):
+        yield numpy.arange(i, min(i + size, n))
+    raise AssertionError("pulled past the end")
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class VectorizedTests(unittest.TestCase):
+    def test_stages(self):
+        """Every stage matches its scalar counterpart across blocks."""
+        pairs = [(V.map(numpy.square), map(msq)),
+                 (V.filter(fodd), filter(fodd)),
+                 (V.remove(fodd), remove(fodd)),
+                 (V.take(11), take(11)),
+                 (V.take(0), take(0)),
+                 (V.drop(11), drop(11)),
+                 (V.take_nth(4), take_nth(4)),
+                 (V.replace({3: -3, 7: -7}), replace({3: -3, 7: -7})),
+                 (compose(V.filter(fodd), V.map(numpy.square), V.take_nth(3),
+                          V.drop(2), V.take(5)),
+                  compose(filter(fodd), map(msq), take_nth(3), drop(2),
+                          take(5)))]
+        for vector, scalar in pairs:
+            self.assertEqual(V.into([], vector, numpy.arange(50), 7),
+                             into([], scalar, range(50)))
+        result = V.into(numpy.arange(2), V.map(numpy.square), range(5), 2)
+        self.assertTrue(isinstance(result, numpy.ndarray))
+        self.assertEqual(result.tolist(), [0, 1, 0, 1, 4, 9, 16])
+
+    def test_partition_all(self):
+        """Rows of n across blocks; the short last row on completion."""
+        rows = V.into([], V.partition_all(3), numpy.arange(10), 4)
+        self.assertEqual([row.tolist() for row in rows],
+                         into([], partition_all(3), range(10)))
+        self.assertEqual(V.into(numpy.empty((0, 2), int), V.partition_all(2),
+                                numpy.arange(6), 4).shape, (3, 2))
+        self.assertRaises(ValueError, V.into, numpy.empty((0, 2), int),
+                          V.partition_all(2), numpy.arange(5), 4)
+        self.assertRaises(ValueError, V.into, numpy.empty(0, int),
+                          V.partition_all(2), numpy.arange(6), 4)
+
+    def test_early_termination(self):
+        """take stops pulling blocks once it has enough."""
+        self.assertEqual(V.into([], V.take(10), blocks(10, 4)),
+                         list(range(10)))
+        self.assertEqual(V.transduce(compose(V.filter(fodd), V.take(3)),
+                                     lambda r=0, b=None: r if b is None
+                                                         else r + b.sum(),
+                                     0, blocks(6, 2)), 1 + 3 + 5)
+
+class VectorizedStageTests(unittest.TestCase):
+    """The parts that run without numpy."""
+    def test_stage_kinds(self):
+        """Block stages describe and pickle themselves like the built-ins,
+        with kinds the scalar rewrites do not know."""
+        xform = compose(V.map(abs), V.take_nth(3), V.partition_all(2))
+        self.assertEqual([_kind(x) for x in _stages(xform)],
+                         ["vectorized.map", "vectorized.take_nth",
+                          "vectorized.partition_all"])
+        self.assertEqual([x.stage for x in _stages(pickle.loads(
+                             pickle.dumps(xform)))],
+                         [x.stage for x in _stages(xform)])
+        self.assertEqual(size_hint(V.map(abs), range(4)), (None, False))
+
+    @unittest.skipIf(numpy is not None, "numpy is installed")
+    def test_requires_numpy(self):
+        """Stages build without numpy; transducing needs it."""
+        self.assertRaises(ImportError, V.into, [], V.take(2), [1, 2, 3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,3 +13,5 @@
 # limitations under the License.
 from . import transducers
 from .transducers import *
+from .profiling import *
+from .sources import *
@@ -0,0 +1,191 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+asyncio versions of transduce and into. They consume async iterables directly
+(plain iterables work too) and accept coroutine functions as the reducing
+function, e.g. an async writer that awaits each row it is handed.
+
+Transducer steps are ordinary synchronous calls: the only awaits are on the
+input iterator and, when it is a coroutine function, on the reducing function.
+The exception is map_async, which runs a coroutine function over items with
+bounded concurrency; chains holding it are split into async stages around it.
+
+This module is not imported with the package, so that importing transducers
+does not load asyncio:
+
+    >>> from transducers.aio import atransduce, ainto
+"""
+import asyncio
+import inspect
+from collections import deque
+
+from .transducers import Missing, Reduced, append, collector, compose, \
+                         unreduced, _as_reducer, _kind, _stage, _stages
+
+__all__ = ["atransduce", "ainto", "map_async"]
+
+def map_async(f, concurrency=8, ordered=True):
+    """Transducer calling the coroutine function f on each item, keeping up to
+    concurrency calls in flight. Results are emitted in input order, or as
+    they complete with ordered=False. Outstanding calls are cancelled once
+    downstream is done. Only usable with atransduce and ainto."""
+    def _map_async_xducer(step):
+        raise TypeError("map_async can only be used with atransduce or ainto.")
+    return _stage(_map_async_xducer, map_async, f, concurrency, ordered)
+
+async def _aiter(coll):
+    for x in coll:
+        yield x
+
+async def _educe(xform, source, owned):
+    """Async generator of the items xform produces from source."""
+    buf = []
+    reducer = _as_reducer(xform(append))
+    step = reducer.step
+    try:
+        async for x in source:
+            ret = step(buf, x)
+            for y in buf:
+                yield y
+            del buf[:]
+            if isinstance(ret, Reduced):
+                break
+        reducer.complete(buf)
+        for y in buf:
+            yield y
+    finally:
+        if owned:
+            await source.aclose()
+
+async def _map_async(source, owned, f, concurrency, ordered):
+    """Async generator of f's results over source, concurrency at a time."""
+    pending = deque() if ordered else set()
+    submit = pending.append if ordered else pending.add
+    async def _next_done():
+        if ordered:
+            return await pending.popleft()
+        done, _ = await asyncio.wait(pending,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        task = done.pop()
+        pending.discard(task)
+        return task.result()
+    try:
+        async for x in source:
+            submit(asyncio.ensure_future(f(x)))
+            if len(pending) >= concurrency:
+                yield await _next_done()
+        while pending:
+            yield await _next_done()
+    finally:
+        for task in pending:
+            task.cancel()
+        if owned:
+            await source.aclose()
+
+def _split(xform, coll):
+    """Turns the map_async stages of xform (and the stages before them) into
+    async generators over coll. Returns the remaining xform, the new source
+    and whether the source is one of those generators."""
+    segment, owned = [], False
+    if not hasattr(coll, "__aiter__"):
+        if not any(_kind(x) == "map_async" for x in _stages(xform)):
+            return xform, coll, False
+        coll, owned = _aiter(coll), True
+    for xducer in _stages(xform):
+        if _kind(xducer) != "map_async":
+            segment.append(xducer)
+            continue
+        if segment:
+            coll, owned = _educe(compose(*segment), coll, owned), True
+            segment = []
+        coll, owned = _map_async(coll, owned, *xducer.stage[1:]), True
+    return (compose(*segment) if segment else _identity), coll, owned
+
+def _identity(step):
+    return step
+
+async def _reduce(step, coll, accum):
+    """Steps each item of coll (async or not) into accum until Reduced."""
+    if hasattr(coll, "__aiter__"):
+        async for x in coll:
+            accum = step(accum, x)
+            if isinstance(accum, Reduced):
+                return accum
+    else:
+        for x in coll:
+            accum = step(accum, x)
+            if isinstance(accum, Reduced):
+                return accum
+    return accum
+
+async def _transduce_async_f(xform, f, start, coll):
+    """Runs xform into a buffer and awaits f on whatever each step (and the
+    completion) produced. The buffer is emptied after every input item."""
+    buf = []
+    reducer = _as_reducer(xform(append))
+    step = reducer.step
+
+    async def _drain(accum):
+        for y in buf:
+            accum = await f(accum, y)
+            if isinstance(accum, Reduced):
+                break
+        del buf[:]
+        return accum
+
+    accum = await f() if start is Missing else start
+    if hasattr(coll, "__aiter__"):
+        async for x in coll:
+            ret = step(buf, x)
+            if buf:
+                accum = await _drain(accum)
+            if isinstance(ret, Reduced) or isinstance(accum, Reduced):
+                break
+    else:
+        for x in coll:
+            ret = step(buf, x)
+            if buf:
+                accum = await _drain(accum)
+            if isinstance(ret, Reduced) or isinstance(accum, Reduced):
+                break
+    reducer.complete(buf)
+    if isinstance(accum, Reduced): # <-- f is done, drop what completion gave.
+        del buf[:]
+        return await f(accum.val)
+    accum = await _drain(accum)
+    return await f(unreduced(accum))
+
+async def atransduce(xform, f, start, coll=Missing):
+    """Like transduce, over an async iterable. f may be a coroutine function,
+    in which case its results are awaited (for each item and on completion);
+    otherwise nothing is awaited besides the input."""
+    if coll is Missing:
+        start, coll = Missing, start
+    xform, coll, owned = _split(xform, coll)
+    try:
+        if inspect.iscoroutinefunction(f):
+            return await _transduce_async_f(xform, f, start, coll)
+        reducer = _as_reducer(xform(f))
+        accum = reducer.init() if start is Missing else start
+        accum = await _reduce(reducer.step, coll, accum)
+        return reducer.complete(unreduced(accum))
+    finally:
+        if owned:
+            await coll.aclose()
+
+async def ainto(target, xducer, coll):
+    """Transduces items from the async iterable coll into target, filling it
+    as into does (see collector)."""
+    rf, start, extend = collector(target)
+    return await atransduce(xducer, rf, start, coll)
@@ -0,0 +1,401 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Parallel reduction in the spirit of Clojure's reducers/fold. An indexable
+collection is split into chunks, each chunk is transduced on its own in a
+worker process (fold) or thread (thread_fold) and the partial results are
+merged with a combining function.
+
+Only transducers whose result does not depend on where the input is cut can be
+folded this way. Anything else (take, drop, dedupe, partition_by, transducers
+we know nothing about, ...) is transduced serially instead.
+
+pmap is a transducer running a blocking function over items in a thread pool.
+pipeline_parallel is a transducer running groups of stages in worker processes
+connected by queues, so stages work at the same time while order is kept.
+
+This module is not imported with the package, so that importing transducers
+does not load multiprocessing and concurrent.futures:
+
+    >>> from transducers.parallel import fold, pmap
+"""
+import array
+import functools
+import multiprocessing
+import os
+import queue
+import sys
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+                               ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
+
+from .transducers import Reduced, Transducer, Transducing, append, \
+                         ensure_reduced, transduce, unreduced, _kind, \
+                         _same_size, _stage, _stages, _SIZE_HINTS
+
+__all__ = ["fold", "thread_fold", "pmap", "pipeline_parallel"]
+
+# Stages that give the same result whether a collection is transduced whole or
+# in chunks whose results are combined afterwards.
+_CHUNKABLE = frozenset(["map", "filter", "remove", "keep", "replace", "cat",
+                        "flatten", "random_sample", "fused"])
+
+# Buffer formats that can be shipped to workers through shared memory.
+_SHAREABLE = frozenset("bBhHiIlLqQfd")
+
+def _chunkable(xform):
+    return all(_kind(xducer) in _CHUNKABLE for xducer in _stages(xform))
+
+def _foldable(xform, coll, n, workers):
+    return _chunkable(xform) and workers != 1 \
+           and hasattr(coll, "__getitem__") and len(coll) > n
+
+def _chunks(coll, n):
+    return [(i, min(i + n, len(coll))) for i in range(0, len(coll), n)]
+
+def _gil_disabled():
+    """True on free-threaded (3.13t+) builds running without the GIL."""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+def _context(start_method=None):
+    """The platform's default start method unless told otherwise. Where that
+    is not fork (macOS, Windows, Python 3.14+ on Linux), xform is pickled to
+    the workers, which works for the built-in transducers as long as their
+    arguments pickle."""
+    return multiprocessing.get_context(start_method)
+
+# Per worker process: the fold arguments, plus the shared input if any.
+_worker = {}
+
+def _init_worker(xform, reducef, combinef, shared=None):
+    _worker.update(xform=xform, reducef=reducef, combinef=combinef)
+    if shared is not None:
+        name, fmt, nbytes = shared
+        _worker["shm"] = shm = shared_memory.SharedMemory(name=name)
+        _worker["coll"] = shm.buf[:nbytes].cast(fmt)
+
+def _fold_items(items):
+    return transduce(_worker["xform"], _worker["reducef"],
+                     _worker["combinef"](), items)
+
+def _fold_shared(start, stop):
+    return _fold_items(_worker["coll"][start:stop])
+
+def _share(coll, shared):
+    """Copies coll into shared memory if asked to (shared=True) or if it is
+    an array/bytes-like whose items read back the same from a memoryview.
+    Other arrays (of unicode characters, say) are left to be pickled."""
+    if shared is None:
+        shared = isinstance(coll, (array.array, bytes, bytearray)) and \
+                 memoryview(coll).format in _SHAREABLE
+    if not shared:
+        return None
+    view = memoryview(coll)
+    if view.ndim != 1 or view.format not in _SHAREABLE \
+       or not view.c_contiguous:
+        raise ValueError("Can only share 1-d contiguous numeric buffers.")
+    shm = shared_memory.SharedMemory(create=True, size=max(view.nbytes, 1))
+    shm.buf[:view.nbytes] = view.cast("B")
+    return shm, (shm.name, view.format, view.nbytes)
+
+def fold(xform, reducef, combinef, coll, n=512, workers=None, shared=None,
+         start_method=None):
+    """Transduces chunks of n items of coll in parallel worker processes and
+    merges the partial results with combinef, starting from combinef(). Each
+    chunk is reduced with reducef, starting from combinef() as well, so
+    combinef called with no arguments must return an identity value.
+
+    coll must support len and slicing. Chunks are pickled to the workers,
+    unless coll is copied once into multiprocessing.shared_memory: this is
+    done for numeric array.array, bytes and bytearray inputs, or any 1-d
+    numeric buffer when shared=True. Falls back to a serial transduce when
+    xform holds stages that depend on order or state, or the input is small.
+
+    Workers are started with the platform's default start method, or
+    start_method ("fork", "spawn" or "forkserver"). Unless they are forked,
+    xform, reducef and combinef must pickle."""
+    if not _foldable(xform, coll, n, workers):
+        return transduce(xform, reducef, combinef(), coll)
+    bounds = _chunks(coll, n)
+    shm, shared = _share(coll, shared) or (None, None)
+    try:
+        with ProcessPoolExecutor(workers, mp_context=_context(start_method),
+                                 initializer=_init_worker,
+                                 initargs=(xform, reducef, combinef,
+                                           shared)) as pool:
+            if shm is None:
+                parts = pool.map(_fold_items,
+                                 (coll[i:j] for i, j in bounds))
+            else:
+                parts = pool.map(_fold_shared, *zip(*bounds))
+            return functools.reduce(combinef, parts, combinef())
+    finally:
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+def thread_fold(xform, reducef, combinef, coll, n=512, workers=None,
+                force=False):
+    """Like fold, but transduces the chunks in a thread pool. Every chunk is
+    reduced by its own reducers (xform is applied to reducef per chunk), so
+    no transducer state is shared between threads.
+
+    Threads only run Python code in parallel on free-threaded builds with the
+    GIL disabled; elsewhere this transduces serially, unless force=True (for
+    stages that release the GIL themselves, e.g. hashing or I/O)."""
+    if not (force or _gil_disabled()) \
+       or not _foldable(xform, coll, n, workers):
+        return transduce(xform, reducef, combinef(), coll)
+    def _fold_chunk(bounds):
+        start, stop = bounds
+        return transduce(xform, reducef, combinef(), coll[start:stop])
+    with ThreadPoolExecutor(workers) as pool:
+        parts = pool.map(_fold_chunk, _chunks(coll, n))
+        return functools.reduce(combinef, parts, combinef())
+
+class _PMap(Transducer):
+    __slots__ = ("f", "workers", "ordered", "limit", "pool", "window")
+    short_circuits = False
+    def __init__(self, rf, f, workers, ordered, prefetch):
+        Transducer.__init__(self, rf)
+        self.f = f
+        self.workers = workers
+        self.ordered = ordered
+        self.limit = workers + prefetch
+        self.pool = None
+        self.window = deque() if ordered else set()
+
+    def _next(self):
+        """Waits for the next result to hand downstream."""
+        if self.ordered:
+            future = self.window.popleft()
+        else:
+            future = next(iter(wait(self.window,
+                                    return_when=FIRST_COMPLETED).done))
+            self.window.remove(future)
+        try:
+            return future.result()
+        except BaseException:
+            self._shutdown()
+            raise
+
+    def _shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        self.window.clear()
+
+    def step(self, r, x):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.workers)
+        future = self.pool.submit(self.f, x)
+        if self.ordered:
+            self.window.append(future)
+        else:
+            self.window.add(future)
+        if len(self.window) >= self.limit:
+            r = self._emit(r)
+            if isinstance(r, Reduced):
+                self._shutdown()
+        return r
+
+    def _emit(self, r):
+        """Steps the next result downstream, cancelling the pending calls if
+        anything raises, so they stop once the reduction has failed."""
+        try:
+            return self.rf_step(r, self._next())
+        except BaseException:
+            self._shutdown()
+            raise
+
+    def complete(self, r):
+        while self.window:
+            r = self._emit(r)
+            if isinstance(r, Reduced):
+                r = r.val
+                break
+        self._shutdown()
+        return self.rf.complete(r)
+
+def pmap(f, workers=None, ordered=True, prefetch=None):
+    """Transducer version of map for blocking functions: f runs in a pool of
+    workers threads, with at most workers + prefetch (prefetch defaults to
+    workers) calls submitted and not yet handed downstream, so memory stays
+    bounded over unbounded input. Results are emitted in input order, or as
+    they complete with ordered=False. Pending calls are cancelled once
+    downstream returns Reduced; the rest are drained on completion."""
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 1) + 4)
+    if prefetch is None:
+        prefetch = workers
+    def _pmap_xducer(step):
+        return _PMap(step, f, workers, ordered, prefetch)
+    return _stage(_pmap_xducer, pmap, f, workers, ordered, prefetch)
+
+# pmap is one result per item, so into and transduce can size for it.
+_SIZE_HINTS["pmap"] = _same_size
+
+class _Failed(object):
+    """Sent down the queues in place of a batch when a stage raised."""
+    def __init__(self, trace):
+        self.trace = trace
+
+def _pipeline_worker(xform, inbox, outbox):
+    """Runs xform over the batches arriving on inbox, sending what it produces
+    for each batch to outbox, and None once done. Keeps draining inbox after
+    xform is done early so upstream never blocks on us."""
+    try:
+        sink = Transducing(xform, append, [])
+        for batch in iter(inbox.get, None):
+            if isinstance(batch, _Failed):
+                outbox.put(batch)
+                return
+            if sink.closed:
+                continue
+            sink.send_many(batch)
+            if sink.is_done:
+                batch = sink.close()
+            else:
+                batch = sink.flush()
+            if batch:
+                outbox.put(batch)
+            if sink.closed:
+                outbox.put(None)
+        if not sink.closed:
+            batch = sink.close()
+            if batch:
+                outbox.put(batch)
+            outbox.put(None)
+    except BaseException:
+        outbox.put(_Failed(traceback.format_exc()))
+
+class _PipelineParallel(Transducer):
+    __slots__ = ("xforms", "queue_size", "batch_size", "start_method",
+                 "batch", "procs", "inbox", "outbox", "finished")
+    def __init__(self, rf, xforms, queue_size, batch_size, start_method):
+        Transducer.__init__(self, rf)
+        self.xforms = xforms
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.start_method = start_method
+        self.batch = []
+        self.procs = None
+        self.finished = False
+
+    def _start(self):
+        ctx = _context(self.start_method)
+        queues = [ctx.Queue(self.queue_size)
+                  for _ in range(len(self.xforms) + 1)]
+        self.inbox, self.outbox = queues[0], queues[-1]
+        self.procs = [ctx.Process(target=_pipeline_worker,
+                                  args=(xform, queues[i], queues[i + 1]),
+                                  daemon=True)
+                      for i, xform in enumerate(self.xforms)]
+        for proc in self.procs:
+            proc.start()
+
+    def _stop(self):
+        """Kills the workers (used when stopping early or failing)."""
+        for proc in self.procs:
+            proc.terminate()
+        for q in (self.inbox, self.outbox):
+            q.cancel_join_thread()
+        for proc in self.procs:
+            proc.join()
+        self.finished = True
+
+    def _receive(self, r, timeout):
+        """Steps every batch waiting on the output queue into r, waiting up to
+        timeout for the first one."""
+        while not self.finished:
+            try:
+                batch = self.outbox.get(timeout=timeout)
+            except queue.Empty:
+                if any(p.exitcode not in (None, 0) for p in self.procs):
+                    self._stop()
+                    raise RuntimeError("pipeline_parallel worker died.")
+                return r
+            timeout = 0
+            if batch is None:
+                self.finished = True
+            elif isinstance(batch, _Failed):
+                self._stop()
+                raise RuntimeError("pipeline_parallel stage failed:\n" +
+                                   batch.trace)
+            else:
+                try:
+                    for x in batch:
+                        r = self.rf_step(r, x)
+                        if isinstance(r, Reduced):
+                            self._stop()
+                            return r
+                except BaseException: # <-- downstream failed, stop workers.
+                    self._stop()
+                    raise
+        return r
+
+    def _send(self, r, batch):
+        """Puts batch on the input queue, handing output downstream while the
+        queue is full so the pipeline cannot deadlock."""
+        if self.procs is None:
+            self._start()
+        while not self.finished:
+            try:
+                self.inbox.put(batch, timeout=0.01)
+                return self._receive(r, 0)
+            except queue.Full:
+                r = self._receive(r, 0)
+        return r
+
+    def step(self, r, x):
+        if self.finished:
+            return Reduced(r)
+        self.batch.append(x)
+        if len(self.batch) >= self.batch_size:
+            batch, self.batch = self.batch, []
+            r = self._send(r, batch)
+            return ensure_reduced(r) if self.finished else r
+        return r
+
+    def complete(self, r):
+        if self.batch and not self.finished:
+            batch, self.batch = self.batch, []
+            r = unreduced(self._send(r, batch))
+        if self.procs is not None and not self.finished:
+            r = unreduced(self._send(r, None))
+            while not self.finished:
+                r = unreduced(self._receive(r, 0.1))
+        if self.procs is not None:
+            self._stop() # <-- workers still draining after an early stop.
+        return self.rf.complete(r)
+
+def pipeline_parallel(*xforms, queue_size=4, batch_size=256,
+                      start_method=None):
+    """Transducer running each of xforms in its own worker process, one after
+    the other: items are sent through bounded multiprocessing queues in lists
+    of batch_size (default 256), at most queue_size (default 4) batches per
+    queue. Stages overlap in time, but every stage sees its input in order and
+    is completed (flushing partitions etc.) in order.
+
+    Items travel between processes by pickling. Workers are started with the
+    platform's default start method, or start_method; unless they are forked,
+    the xforms must pickle too."""
+    def _pipeline_parallel_xducer(step):
+        return _PipelineParallel(step, xforms, queue_size, batch_size,
+                                 start_method)
+    return _stage(_pipeline_parallel_xducer, pipeline_parallel, *xforms,
+                  queue_size=queue_size, batch_size=batch_size,
+                  start_method=start_method)
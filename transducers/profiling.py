@@ -0,0 +1,139 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Per-stage profiling of composed transducers. profile(xform) is a drop-in
+replacement for xform that counts the items going into and out of every stage
+and times each of them:
+
+    >>> xform = profile(compose(map(f), filter(pred), partition_all(10)))
+    >>> transduce(xform, append, [], coll)
+    >>> print(xform.report())
+
+Nothing is instrumented unless profile is used.
+"""
+import time
+
+from .transducers import Transducer, _kind, _stages
+
+__all__ = ["profile"]
+
+class _Probe(Transducer):
+    """Counts and times the calls made into the reducer it wraps."""
+    __slots__ = ("items", "ns")
+    short_circuits = False
+    def __init__(self, rf):
+        Transducer.__init__(self, rf)
+        self.items = 0
+        self.ns = 0
+
+    def step(self, r, x):
+        self.items += 1
+        t = time.perf_counter_ns()
+        r = self.rf_step(r, x)
+        self.ns += time.perf_counter_ns() - t
+        return r
+
+    def complete(self, r):
+        t = time.perf_counter_ns()
+        r = self.rf.complete(r)
+        self.ns += time.perf_counter_ns() - t
+        return r
+
+def _describe(xducer):
+    stage = getattr(xducer, "stage", None)
+    if stage is None:
+        return getattr(xducer, "__name__", type(xducer).__name__)
+    if _kind(xducer) == "fused":
+        return "fused(" + ", ".join(_describe(s) for s in stage[1]) + ")"
+    args = ", ".join(getattr(a, "__name__", None) or repr(a) for a in stage[1:])
+    if len(args) > 30:
+        args = args[:27] + "..."
+    return stage[0] + ("(" + args + ")" if args else "")
+
+class _Profile(object):
+    """A transducer instrumenting the stages of xform. Each time it is applied
+    (once per transduce) the counters start again from zero."""
+    def __init__(self, xform):
+        self.xform = xform
+        # not "stages": the pipeline rewrites must see this as one opaque
+        # stage, or they run xform's stages without the probes.
+        self._inner_stages = _stages(xform)
+        self.probes = None
+        self.f = None
+
+    def __call__(self, rf):
+        self.f = rf
+        rf = _Probe(rf)
+        probes = [rf]
+        for xducer in reversed(self._inner_stages):
+            rf = _Probe(xducer(rf))
+            probes.append(rf)
+        self.probes = probes[::-1]
+        return rf
+
+    def report(self):
+        if self.probes is None:
+            raise ValueError("profile report requested before the "
+                             "transducer was used.")
+        names = [_describe(x) for x in self._inner_stages] + \
+                [getattr(self.f, "__name__", type(self.f).__name__)]
+        probes = self.probes
+        rows = []
+        for i, name in enumerate(names):
+            last = i == len(names) - 1
+            items = probes[i].items
+            out = None if last else probes[i + 1].items
+            rows.append({"stage": name,
+                         "in": items,
+                         "out": out,
+                         "selectivity": float(out) / items
+                                        if items and not last else None,
+                         "cumulative_ns": probes[i].ns,
+                         "self_ns": probes[i].ns -
+                                    (0 if last else probes[i + 1].ns)})
+        return ProfileReport(rows)
+
+class ProfileReport(object):
+    """Per-stage counts and times from a profiled run. rows holds one dict per
+    stage, then one for the reducing function, with the keys stage, in, out,
+    selectivity (out / in), cumulative_ns (the stage and everything after it)
+    and self_ns. Timings include some of the probes' own overhead."""
+    def __init__(self, rows):
+        self.rows = rows
+        self.total_ns = rows[0]["cumulative_ns"] if rows else 0
+
+    def as_dict(self):
+        return {"total_ns": self.total_ns, "stages": self.rows}
+
+    def __str__(self):
+        lines = ["%3s  %-36s %10s %10s %7s %10s %10s %6s"
+                 % ("#", "stage", "in", "out", "sel", "cum ms", "self ms",
+                    "self%")]
+        for i, row in enumerate(self.rows):
+            lines.append("%3d  %-36s %10d %10s %7s %10.3f %10.3f %5.1f%%"
+                         % (i, row["stage"][:36], row["in"],
+                            "" if row["out"] is None else row["out"],
+                            "" if row["selectivity"] is None
+                               else "%.3f" % row["selectivity"],
+                            row["cumulative_ns"] / 1e6, row["self_ns"] / 1e6,
+                            100.0 * row["self_ns"] / (self.total_ns or 1)))
+        return "\n".join(lines)
+
+    __repr__ = __str__
+
+def profile(xform):
+    """Wraps xform (usually a compose(...)) so that each run records how many
+    items every stage took in and passed on, and the time spent in it. Call
+    report() on the result after a run for a ProfileReport."""
+    return _Profile(xform)
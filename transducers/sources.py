@@ -0,0 +1,160 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+File sources reading in bulk. lines(path) and records(path, size) read large
+chunks (or map the file with mmap=True) and split each chunk into lines or
+fixed size records at once, instead of going through a text file object line
+by line:
+
+    >>> transduce(compose(filter(is_error), take(10)), append, [],
+    ...           lines("server.log"))
+
+They reduce themselves (see coll_reduce), handing every chunk's worth of
+items to the reducer's step_many, and can also be iterated, any number of
+times. The file is opened for each reduction or iteration and closed as soon
+as it ends, early termination included.
+"""
+import mmap as _mmap
+import os
+
+from .transducers import Reduced
+
+__all__ = ["lines", "records"]
+
+class _FileSource(object):
+    def __init__(self, path, chunk_size, mmap):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.mmap = mmap
+
+    def _chunks(self, f, size):
+        """bytes chunks of size read from f, or copied out of a map of it."""
+        if not self.mmap:
+            read = f.read
+            chunk = read(size)
+            while chunk:
+                yield chunk
+                chunk = read(size)
+            return
+        if os.fstat(f.fileno()).st_size == 0:
+            return # <-- empty files cannot be mapped.
+        mm = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        try:
+            if hasattr(mm, "madvise") and hasattr(_mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(_mmap.MADV_SEQUENTIAL)
+            for pos in range(0, len(mm), size):
+                yield mm[pos:pos + size]
+        finally:
+            mm.close()
+
+    def _batches(self):
+        """Lists of items, one per chunk read; the file stays open until this
+        generator is exhausted or closed."""
+        with open(self.path, "rb") as f:
+            for batch in self._split(self._chunks(f, self.chunk_size)):
+                yield batch
+
+    def __iter__(self):
+        batches = self._batches()
+        try:
+            for batch in batches:
+                for x in batch:
+                    yield x
+        finally:
+            batches.close()
+
+    def __transduce_reduce__(self, rf, init):
+        batches = self._batches()
+        try:
+            r = init
+            step_many = rf.step_many
+            for batch in batches:
+                r = step_many(r, batch)
+                if isinstance(r, Reduced):
+                    return r.val
+            return r
+        finally:
+            batches.close()
+
+def _line_views(data):
+    """memoryview slices of data between newlines, without copying."""
+    views, start, find, mv = [], 0, data.find, memoryview(data)
+    end = find(b"\n")
+    while end >= 0:
+        views.append(mv[start:end])
+        start = end + 1
+        end = find(b"\n", start)
+    views.append(mv[start:])
+    return views
+
+class _Lines(_FileSource):
+    def __init__(self, path, encoding, errors, chunk_size, mmap, view):
+        _FileSource.__init__(self, path, chunk_size, mmap)
+        self.encoding = encoding
+        self.errors = errors
+        self.view = view
+
+    def _lines(self, data):
+        if self.view:
+            return _line_views(data)
+        return data.decode(self.encoding, self.errors).split("\n")
+
+    def _split(self, chunks):
+        rest = b""
+        for chunk in chunks:
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                rest += chunk
+                continue
+            data = rest + chunk[:end] if rest else chunk[:end]
+            rest = chunk[end + 1:]
+            yield self._lines(data)
+        if rest:
+            yield self._lines(rest)
+
+def lines(path, encoding="utf-8", errors="strict", chunk_size=1 << 20,
+          mmap=False, view=False):
+    """The lines of the file at path, without their line ends, read
+    chunk_size bytes at a time (from a memory map of the file with
+    mmap=True). Lines are split on b"\\n" before decoding, so the encoding
+    must be ASCII compatible (UTF-8, Latin-1, ...); a "\\r" before it is kept.
+
+    With view=True lines are not decoded: each is a read-only memoryview of
+    the chunk it was read in, which stays alive as long as views of it do."""
+    return _Lines(path, encoding, errors, chunk_size, mmap, view)
+
+class _Records(_FileSource):
+    def __init__(self, path, record_size, chunk_size, mmap, view):
+        # whole records per chunk, so none straddles two.
+        chunk_size = max(chunk_size // record_size, 1) * record_size
+        _FileSource.__init__(self, path, chunk_size, mmap)
+        self.record_size = record_size
+        self.view = view
+
+    def _split(self, chunks):
+        size = self.record_size
+        for chunk in chunks:
+            if self.view:
+                chunk = memoryview(chunk)
+            yield [chunk[i:i + size] for i in range(0, len(chunk), size)]
+
+def records(path, record_size, chunk_size=1 << 20, mmap=False, view=False):
+    """The fixed size records of the file at path, as bytes of record_size
+    (the last one shorter if the file size is not a multiple of it), read
+    about chunk_size bytes at a time (from a memory map of the file with
+    mmap=True). With view=True records are read-only memoryviews of the
+    chunk they were read in instead of copies."""
+    if not (isinstance(record_size, int) and record_size > 0):
+        raise ValueError("records needs a positive integer record_size.")
+    return _Records(path, record_size, chunk_size, mmap, view)
@@ -11,7 +11,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import array
+import builtins
 import functools
+import itertools
+import operator
+import sys
+from collections import deque
+from collections.abc import Sequence
 from random import random
 """
 This is an implementation of Rich Hickey's Transducers from Clojure in Python.
@@ -30,6 +37,15 @@ transformation before the reducing function it accepts as an argument.
 Transducers can be called with transduce or transduce into a collection with
 into.
 """
+__all__ = ["Missing", "Reduced", "ensure_reduced", "unreduced", "Transducer",
+           "reduce", "coll_reduce", "compose", "compile_xform", "size_hint",
+           "transduce", "Transducing", "map", "filter", "cat", "mapcat",
+           "flatten", "take", "take_while", "drop", "drop_while", "take_nth",
+           "replace", "keep", "remove", "keep_indexed", "dedupe",
+           "partition_by", "partition_all", "partition", "sliding",
+           "random_sample", "append", "collector", "into", "Eduction",
+           "eduction"]
+
 class Missing(object):
     """Only for 'is' comparison to simplify arity testing. This is because None
     is a legal argument differing from 'Not supplied.'"""
@@ -49,22 +65,146 @@ def ensure_reduced(x):
 def unreduced(x):
     return x.val if isinstance(x, Reduced) else x
 
+class _Arity(object):
+    """Adapts a function-style step (one function that branches on arity) to
+    the init/step/complete protocol. The function itself is used for all
+    three, so this adds no call per item. Like a Transducer, it is callable
+    with the usual arities, so function-style transducers can wrap it."""
+    __slots__ = ("init", "step", "complete", "step_many")
+    def __init__(self, f):
+        self.init = self.step = self.complete = f
+        self.step_many = getattr(f, "step_many", None) or \
+                         functools.partial(_step_each, f)
+
+    def __call__(self, r=Missing, x=Missing):
+        if r is Missing: return self.init()
+        if x is Missing: return self.complete(r)
+        return self.step(r, x)
+
+def _step_each(step, r, xs):
+    for x in xs:
+        r = step(r, x)
+        if isinstance(r, Reduced):
+            return r
+    return r
+
+def _as_reducer(rf):
+    return rf if isinstance(rf, (Transducer, _Arity)) else _Arity(rf)
+
+class Transducer(object):
+    """Base class for the reducing steps built by transducers. A subclass is
+    constructed with the downstream reducing function rf and overrides step,
+    and init or complete when it needs to. transduce calls these methods
+    directly, without testing arity on every item.
+
+    rf may be a Transducer or a function-style step; rf_step is its step,
+    looked up once, and rf_step_many its step_many. Instances are also
+    callable with the usual arities, so function-style transducers can wrap
+    them. Keep per-run state in __slots__ attributes set in __init__.
+
+    step_many(r, xs) steps a list of items at once, as transduce does with
+    batch_size. It must give the same result as stepping them one by one,
+    stopping at the first Reduced; by default it does just that. Stages can
+    override it to process the whole list and hand their output downstream
+    as one list with rf_step_many.
+
+    Set short_circuits = False on subclasses whose step never returns a
+    Reduced of its own making; transduce skips the per-item Reduced check
+    when no stage (nor the final reducing function) can short circuit."""
+    __slots__ = ("rf", "rf_step", "rf_step_many")
+    short_circuits = True
+    def __init__(self, rf):
+        self.rf = _as_reducer(rf)
+        self.rf_step = self.rf.step
+        self.rf_step_many = self.rf.step_many
+
+    def init(self):
+        return self.rf.init()
+
+    def step(self, r, x):
+        return self.rf_step(r, x)
+
+    def step_many(self, r, xs):
+        return _step_each(self.step, r, xs)
+
+    def complete(self, r):
+        return self.rf.complete(r)
+
+    def __call__(self, r=Missing, x=Missing):
+        if r is Missing: return self.init()
+        if x is Missing: return self.complete(r)
+        return self.step(r, x)
+
+def _short_circuits(rf):
+    """Whether the reducer chain rf may return Reduced. Function-style steps
+    are assumed to unless they carry short_circuits = False (as append
+    does)."""
+    while isinstance(rf, Transducer):
+        if rf.short_circuits:
+            return True
+        rf = rf.rf
+    return getattr(rf.step, "short_circuits", True)
+
 def reduce(function, iterable, initializer=Missing):
     """
     For loop impl of reduce in Python that honors sentinal wrapper Reduced and
     uses it to signal early termination.
     """
+    rf = _as_reducer(function)
     if initializer is Missing:
-        accum_value = function() # 0 arity initializer.
+        accum_value = rf.init() # 0 arity initializer.
     else:
         accum_value = initializer
+    if _reduces_itself(iterable):
+        return coll_reduce(iterable, rf, accum_value)
 
+    step = rf.step
     for x in iterable:
-        accum_value = function(accum_value, x)
+        accum_value = step(accum_value, x)
         if isinstance(accum_value, Reduced): # <-- here's where we can terminate early.
             return accum_value.val
     return accum_value
 
+@functools.singledispatch
+def coll_reduce(coll, rf, init):
+    """Reduces coll with the reducer rf (which has step(r, x) and
+    step_many(r, xs) methods, both able to return Reduced) starting from init,
+    and returns the result, unwrapped if Reduced. Completion is left to the
+    caller. reduce, transduce and into go through this first for collections
+    that know how to reduce themselves faster than a for loop over them,
+    e.g. by chunks, or a cursor with fetchmany:
+
+    > @coll_reduce.register(Cursor)
+    > def _(cursor, rf, init):
+    >     r = init
+    >     for rows in iter(lambda: cursor.fetchmany(1000), []):
+    >         r = rf.step_many(r, rows)
+    >         if isinstance(r, Reduced):
+    >             return r.val
+    >     return r
+
+    Instead of being registered, a collection class may define the method
+    __transduce_reduce__(self, rf, init) doing the same. Anything else is
+    reduced item by item."""
+    method = getattr(type(coll), "__transduce_reduce__", None)
+    if method is not None:
+        return method(coll, rf, init)
+    return reduce(rf, coll, init)
+
+def _reduces_itself(coll):
+    cls = type(coll)
+    return hasattr(cls, "__transduce_reduce__") or \
+           coll_reduce.dispatch(cls) is not coll_reduce.registry[object]
+
+class _Completing(_Arity):
+    """Reducer stepping with rf, but completing with the identity, for a
+    source reducing itself into rf and leaving completion to its caller."""
+    __slots__ = ()
+    def __init__(self, rf):
+        rf = _as_reducer(rf)
+        self.init, self.step, self.step_many = rf.init, rf.step, rf.step_many
+        self.complete = _identity
+
 
 def compose(*fns):
     """Compose functions using reduce on splat.
@@ -74,276 +214,945 @@ def compose(*fns):
     Note: order of inner function application with transducers is inverted from
     the composition of the transducers.
     """
-    return functools.reduce(lambda f,g: lambda x: f(g(x)), fns)
+    if len(fns) == 1:
+        return fns[0]
+    return _Composed(fns)
+
+class _Composed(object):
+    """Result of compose: calls fns right to left. Keeps the flat tuple of
+    transducers making it up (stages) and pickles as the compose call."""
+    __slots__ = ("fns", "stages")
+    def __init__(self, fns):
+        self.fns = fns
+        self.stages = tuple(s for fn in fns for s in _stages(fn))
+
+    def __call__(self, x):
+        for fn in reversed(self.fns):
+            x = fn(x)
+        return x
+
+    def __reduce__(self):
+        return (compose, self.fns)
+
+class _Stage(object):
+    """A built-in transducer. Besides building reducers when called, it
+    describes itself as stage, its kind and arguments (e.g., ("map", f)), so
+    composed pipelines can be inspected and rewritten. It pickles as the call
+    that made it, so the reducers get rebuilt wherever it is unpickled (which
+    works as long as the arguments pickle)."""
+    __slots__ = ("xducer", "stage", "rebuild")
+    def __init__(self, xducer, stage, rebuild):
+        self.xducer = xducer
+        self.stage = stage
+        self.rebuild = rebuild
+
+    def __call__(self, step):
+        return self.xducer(step)
+
+    def __reduce__(self):
+        return (self.rebuild, self.stage[1:])
+
+def _stage(xducer, factory, *args, **kwargs):
+    """Wraps the transducer returned by factory(*args, **kwargs)."""
+    rebuild = functools.partial(factory, **kwargs) if kwargs else factory
+    return _Stage(xducer, (factory.__name__,) + args, rebuild)
+
+def _stages(xform):
+    """Flat tuple of the transducers making up xform, in data-flow order."""
+    return getattr(xform, "stages", (xform,))
+
+def _kind(xducer):
+    return getattr(xducer, "stage", (None,))[0]
+
+# Code for each stateless stage inside a fused step. The stage's argument is
+# bound to a{i}; x holds the item and dropping it means returning r.
+_FUSIBLE = {"map":     ["x = a{i}(x)"],
+            "filter":  ["if not a{i}(x): return r"],
+            "remove":  ["if a{i}(x): return r"],
+            "keep":    ["x = a{i}(x)",
+                        "if x is None: return r"],
+            "replace": ["if x in a{i}: x = a{i}[x]"]}
+
+def _fuse(run):
+    """Generates a single step function doing the work of a run of stateless
+    stages, so each item costs one Python call instead of one per stage."""
+    namespace = {"Transducer": Transducer}
+    args, body = [], []
+    for i, xducer in enumerate(run):
+        namespace["a%d" % i] = xducer.stage[1]
+        args.append("a%d=a%d" % (i, i)) # <-- bound as fast locals.
+        body.extend(line.format(i=i) for line in _FUSIBLE[_kind(xducer)])
+    source = "\n".join(
+        ["class _Fused(Transducer):",
+         "    __slots__ = ()",
+         "    short_circuits = False",
+         "    def step(self, r, x, %s):" % ", ".join(args)] +
+        ["        " + line for line in body] +
+        ["        return self.rf_step(r, x)",
+         "def _fused_xducer(step):",
+         "    return _Fused(step)"])
+    exec(compile(source, "<fused %s>" % "/".join(_kind(s) for s in run),
+                 "exec"), namespace)
+    return _Stage(namespace["_fused_xducer"], ("fused", tuple(run)), _fuse)
+
+def compile_xform(xform):
+    """Returns a transducer equivalent to xform with each run of adjacent
+    stateless stages (map, filter, remove, keep, replace) fused into one
+    generated step function. Other stages are kept as they are."""
+    fused, run = [], []
+    for xducer in _stages(xform) + (None,):
+        if _kind(xducer) in _FUSIBLE:
+            run.append(xducer)
+            continue
+        fused.extend([_fuse(run)] if len(run) > 1 else run)
+        run = []
+        if xducer is not None:
+            fused.append(xducer)
+    return compose(*fused)
+
+
+_not_none = functools.partial(operator.is_not, None)
+
+def _lower_replace(it, smap):
+    if not isinstance(smap, dict):
+        return None
+    return builtins.map(smap.get, *itertools.tee(it))
+
+def _lower_fused(it, run):
+    for xducer in run:
+        it = _ITERTOOLS[_kind(xducer)](it, *xducer.stage[1:])
+        if it is None:
+            return None
+    return it
+
+def _positive_int(n):
+    return isinstance(n, int) and n > 0
+
+# Iterator equivalents of built-in stages, each taking the upstream iterator
+# and the stage's arguments. None means no equivalent for those arguments.
+_ITERTOOLS = {
+    "map": lambda it, f: builtins.map(f, it),
+    "filter": lambda it, pred: builtins.filter(pred, it),
+    "remove": lambda it, pred: itertools.filterfalse(pred, it),
+    "keep": lambda it, f: builtins.filter(_not_none, builtins.map(f, it)),
+    "keep_indexed": lambda it, f: builtins.filter(
+        _not_none, itertools.starmap(f, enumerate(it))),
+    "replace": _lower_replace,
+    "cat": lambda it: itertools.chain.from_iterable(it),
+    "take": lambda it, n: itertools.islice(it, max(n, 0))
+                          if isinstance(n, int) else None,
+    "drop": lambda it, n: itertools.islice(it, max(n, 0), None)
+                          if isinstance(n, int) else None,
+    "take_nth": lambda it, n: itertools.islice(it, 0, None, n)
+                              if _positive_int(n) else None,
+    "take_while": lambda it, pred: itertools.takewhile(pred, it),
+    "drop_while": lambda it, pred: itertools.dropwhile(pred, it),
+    "dedupe": lambda it: builtins.map(operator.itemgetter(0),
+                                      itertools.groupby(it)),
+    "partition_by": lambda it, pred, tuples=False: builtins.map(
+        tuple if tuples else list,
+        builtins.map(operator.itemgetter(1), itertools.groupby(it, pred))),
+    "fused": _lower_fused}
+
+def _lower(xform, coll):
+    """Rewrites xform applied to coll as a chain of itertools (and builtin
+    map/filter) iterators, or returns None if some stage has no equivalent."""
+    it = iter(coll)
+    for xducer in _stages(xform):
+        lowering = _ITERTOOLS.get(_kind(xducer))
+        if lowering is None:
+            return None
+        it = lowering(it, *xducer.stage[1:])
+        if it is None:
+            return None
+    return it
+
+# Stages giving one item for each item in, whatever its position, so counting
+# stages after them can be moved before them.
+_ONE_TO_ONE = frozenset(["map", "replace"])
+
+def _one_to_one(xducer):
+    if _kind(xducer) == "fused":
+        return all(_kind(x) in _ONE_TO_ONE for x in xducer.stage[1])
+    return _kind(xducer) in _ONE_TO_ONE
 
+def _slice_index(indices, xducer):
+    """The positions left of indices (a range) after xducer, or None."""
+    kind, args = _kind(xducer), getattr(xducer, "stage", ())[1:]
+    if kind in ("take", "drop") and isinstance(args[0], int):
+        n = max(args[0], 0)
+        return indices[:n] if kind == "take" else indices[n:]
+    if kind == "take_nth" and _positive_int(args[0]):
+        return indices[::args[0]]
+    return None
 
-def transduce(xform, f, start, coll=Missing):
+class _Indexed(object):
+    """The items of the sequence coll at indices (a range), read as it is
+    iterated rather than copied out as a slice would."""
+    __slots__ = ("coll", "indices")
+    def __init__(self, coll, indices):
+        self.coll = coll
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        # islice walks past the skipped items in C, which is faster than
+        # indexing (slow for deques anyway), and it never steps them.
+        indices = self.indices
+        return itertools.islice(self.coll, indices.start, indices.stop,
+                                indices.step)
+
+def _push_down(xform, coll):
+    """Moves the drop, take and take_nth stages at the head of xform (where
+    only map and replace may come before them) into indexing coll, if it is a
+    sequence, so the items they skip are never stepped. Only a contiguous
+    range of at most half of coll (as take usually keeps) is sliced out;
+    otherwise the kept items are read from coll as they are needed. Returns
+    the xform and coll to use instead."""
+    stages = _stages(xform)
+    indices, kept, i = None, [], 0
+    for i, xducer in enumerate(stages):
+        if _one_to_one(xducer):
+            kept.append(xducer)
+            continue
+        if _kind(xducer) not in ("take", "drop", "take_nth"):
+            break
+        if indices is None:
+            if isinstance(coll, range):
+                indices = coll # <-- its own items; slices at any length.
+            elif not isinstance(coll, Sequence):
+                break
+            else:
+                try:
+                    indices = range(len(coll))
+                except OverflowError:
+                    break
+        sliced = _slice_index(indices, xducer)
+        if sliced is None:
+            break
+        indices = sliced
+    else:
+        i = len(stages)
+    if indices is None:
+        return xform, coll
+    if isinstance(coll, range):
+        coll = indices
+    elif len(indices) == len(coll):
+        pass
+    elif isinstance(coll, (list, tuple, range, str, bytes)) and \
+         indices.step == 1 and 2 * len(indices) <= len(coll):
+        coll = coll[indices.start:indices.stop] # <-- small, copy it.
+    else:
+        coll = _Indexed(coll, indices)
+    return compose(*(tuple(kept) + stages[i:])), coll
+
+def _same_size(n, exact, *args):
+    return n, exact
+
+def _at_most(n, exact, *args):
+    return n, False
+
+def _take_size(n, exact, k):
+    if n is None or not isinstance(k, int):
+        return None, False
+    return min(n, max(k, 0)), exact
+
+def _drop_size(n, exact, k):
+    if n is None or not isinstance(k, int):
+        return n, False
+    return max(n - max(k, 0), 0), exact
+
+def _every_nth_size(n, exact, k, *args):
+    if n is None or not _positive_int(k):
+        return None, False
+    return -(-n // k), exact
+
+def _partition_size(n, exact, k, step, *args):
+    if n is None:
+        return None, False
+    return (n - k) // step + 1 if n >= k else 0, exact
+
+def _fused_size(n, exact, run):
+    for xducer in run:
+        n, exact = _SIZE_HINTS[_kind(xducer)](n, exact, *xducer.stage[1:])
+    return n, exact
+
+# How built-in stages change the number of items: each takes the incoming
+# count n (None if unknown), whether it is exact, and the stage's arguments,
+# and returns the same pair for the outgoing items.
+_SIZE_HINTS = {
+    "map": _same_size,
+    "replace": _same_size,
+    "filter": _at_most,
+    "remove": _at_most,
+    "keep": _at_most,
+    "keep_indexed": _at_most,
+    "take_while": _at_most,
+    "drop_while": _at_most,
+    "dedupe": _at_most,
+    "partition_by": _at_most,
+    "random_sample": _at_most,
+    "take": _take_size,
+    "drop": _drop_size,
+    "take_nth": _every_nth_size,
+    "partition_all": _every_nth_size,
+    "partition": _partition_size,
+    "fused": _fused_size}
+
+def size_hint(xform, coll):
+    """Returns (n, exact): how many items xform produces from coll, exactly
+    or as an upper bound, with n None if that is unknown. The input count
+    comes from len(coll), or as an estimate from its __length_hint__. Stages
+    other than the built-ins may report how they change the count with a
+    size_hint(n, exact) attribute returning the same kind of pair."""
+    try:
+        n, exact = len(coll), True
+    except OverflowError: # <-- longer than sys.maxsize, e.g. a huge range.
+        n, exact = None, False
+    except TypeError:
+        n, exact = operator.length_hint(coll, -1), False
+        if n < 0:
+            n = None
+    for xducer in _stages(xform):
+        hint = _SIZE_HINTS.get(_kind(xducer))
+        if hint is not None:
+            n, exact = hint(n, exact, *xducer.stage[1:])
+        elif hasattr(xducer, "size_hint"):
+            n, exact = xducer.size_hint(n, exact)
+        else:
+            n, exact = None, False
+    return n, exact
+
+class _Sized(object):
+    """An iterable handing out it, with the exact number of items it gives as
+    length hint, so that list.extend and numpy.fromiter allocate once."""
+    __slots__ = ("it", "n")
+    def __init__(self, it, n):
+        self.it = it
+        self.n = n
+
+    def __iter__(self):
+        return self.it
+
+    def __length_hint__(self):
+        return self.n
+
+def _sized(lowered, xform, coll):
+    """Only exact counts are passed on: list.extend preallocates whatever it
+    is told, so an upper bound (take(10 ** 9) of a generator, a filter of a
+    big range) would allocate for items that never come."""
+    n, exact = size_hint(xform, coll)
+    return _Sized(lowered, n) if exact else lowered
+
+def _reduce_batches(reducer, coll, start, batch_size):
+    step_many = reducer.step_many
+    it = iter(coll)
+    ret = start
+    while True:
+        xs = list(itertools.islice(it, batch_size))
+        if not xs:
+            return ret
+        ret = step_many(ret, xs)
+        if isinstance(ret, Reduced):
+            return ret.val
+
+def transduce(xform, f, start, coll=Missing, engine="reduce",
+              batch_size=None):
     """Return the results of calling transduce on the reducing function,
     can compose transducers using compose defined above.
+
+    engine="itertools" runs xform as a chain of C-level iterators when every
+    stage has an equivalent, and falls back to the reducer otherwise. When f
+    is append this is always tried, and the survivors are added with a single
+    extend call.
+
+    With batch_size, items are read batch_size at a time and each list goes
+    through the chain with step_many (see Transducer), which most built-ins
+    handle in one go. The result is the same, but functions may be called on
+    the rest of a batch after the reduction has stopped, and up to
+    batch_size - 1 extra items are read from coll.
     """
     if coll is Missing:
-        return transduce(xform, f, f(), start)
-    reducer = xform(f)
-    ret = reduce(reducer, coll, start)
-    return reducer(ret) # completing step moved to here
+        return transduce(xform, f, f(), start, engine, batch_size)
+    if engine not in ("reduce", "itertools"):
+        raise ValueError("Unknown engine: " + repr(engine))
+    if _reduces_itself(coll):
+        reducer = _as_reducer(xform(f))
+        return reducer.complete(coll_reduce(coll, reducer, start))
+    xform, coll = _push_down(xform, coll)
+    if engine == "itertools" or f is append:
+        lowered = _lower(xform, coll)
+        if lowered is not None:
+            if f is append and hasattr(start, "extend"):
+                # bulk append of the survivors, sized up front when possible.
+                start.extend(_sized(lowered, xform, coll))
+                return start
+            return f(reduce(f, lowered, start))
+    reducer = _as_reducer(xform(f))
+    if batch_size:
+        ret = _reduce_batches(reducer, coll, start, batch_size)
+    elif _short_circuits(reducer):
+        ret = reduce(reducer, coll, start)
+    else:
+        step, ret = reducer.step, start
+        for x in coll:
+            ret = step(ret, x)
+    return reducer.complete(ret) # completing step moved to here
+
+class Transducing(object):
+    """Push-style transduction for items that arrive one (or a few) at a
+    time. One reducer chain is kept alive across calls, so stateful stages
+    (partition_all, dedupe, ...) carry their state from one send to the next.
+
+    send/send_many step items into the accumulated value; flush returns the
+    value accumulated so far and starts a new one from f's init arity, without
+    completing anything; close completes the reducer chain (flushing partial
+    partitions) and returns the final value. is_done becomes True once the
+    reduction has seen Reduced, after which sent items are ignored."""
+    def __init__(self, xform, f, init=Missing):
+        self._reducer = _as_reducer(xform(f))
+        self._step = self._reducer.step
+        self._accum = self._reducer.init() if init is Missing else init
+        self.is_done = False
+        self.closed = False
+
+    def send(self, x):
+        if self.closed:
+            raise ValueError("send on closed Transducing.")
+        if not self.is_done:
+            accum = self._step(self._accum, x)
+            if isinstance(accum, Reduced):
+                self.is_done = True
+                accum = accum.val
+            self._accum = accum
+
+    def send_many(self, iterable):
+        if self.closed:
+            raise ValueError("send on closed Transducing.")
+        if not self.is_done:
+            step, accum = self._step, self._accum
+            for x in iterable:
+                accum = step(accum, x)
+                if isinstance(accum, Reduced):
+                    self.is_done = True
+                    accum = accum.val
+                    break
+            self._accum = accum
+
+    def flush(self):
+        accum = self._accum
+        if not self.closed:
+            self._accum = self._reducer.init()
+        return accum
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._accum = self._reducer.complete(self._accum)
+        return self._accum
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 # Transducers
+class _Map(Transducer):
+    __slots__ = ("f",)
+    short_circuits = False
+    def __init__(self, rf, f):
+        Transducer.__init__(self, rf)
+        self.f = f
+
+    def step(self, r, x):
+        return self.rf_step(r, self.f(x))
+
+    def step_many(self, r, xs):
+        return self.rf_step_many(r, list(builtins.map(self.f, xs)))
+
 def map(f):
     """Transducer version of map, returns f(item) with each reduction step."""
     def _map_xducer(step):
-        def _map_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            return step(r) if x is Missing else step(r, f(x))
-        return _map_step
-    return _map_xducer
+        return _Map(step, f)
+    return _stage(_map_xducer, map, f)
+
+class _Filter(Transducer):
+    __slots__ = ("pred",)
+    short_circuits = False
+    def __init__(self, rf, pred):
+        Transducer.__init__(self, rf)
+        self.pred = pred
+
+    def step(self, r, x):
+        return self.rf_step(r, x) if self.pred(x) else r
+
+    def step_many(self, r, xs):
+        xs = list(builtins.filter(self.pred, xs))
+        return self.rf_step_many(r, xs) if xs else r
 
 def filter(pred):
     """Transducer version of filter."""
     def _filter_xducer(step):
-        def _filter_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            return step(r, x) if pred(x) else r
-        return _filter_step
-    return _filter_xducer
+        return _Filter(step, pred)
+    return _stage(_filter_xducer, filter, pred)
+
+class _Cat(Transducer):
+    __slots__ = ()
+    short_circuits = False
+    def step(self, r, x):
+        # stops at Reduced and passes it on as is, so the outer loop stops too.
+        return _step_each(self.rf_step, r, x)
 
 def cat(step):
     """Cat transducers (will cat items from nested lists, e.g.)."""
-    def _cat_step(r=Missing, x=Missing):
-        if r is Missing: return step()
-        return step(r) if x is Missing else functools.reduce(step, x, r)
-    return _cat_step
+    return _Cat(step)
+cat.stage = ("cat",)
 
 def mapcat(f):
     """Mapcat transducer - maps to a collection then cats item into one less
     level of nesting."""
     return compose(map(f), cat)
 
+# Iterables flatten passes on whole.
+_ATOMS = (str, bytes, bytearray, dict)
+
+def _nested(x):
+    return hasattr(x, "__iter__") and not isinstance(x, _ATOMS)
+
+class _Flatten(Transducer):
+    __slots__ = ()
+    short_circuits = False
+    def step(self, r, x):
+        if not _nested(x):
+            return self.rf_step(r, x)
+        step = self.rf_step
+        stack = [iter(x)]
+        while stack:
+            for y in stack[-1]:
+                if _nested(y):
+                    stack.append(iter(y))
+                    break
+                r = step(r, y)
+                if isinstance(r, Reduced):
+                    return r
+            else:
+                stack.pop()
+        return r
+
+def flatten(step):
+    """Passes on the items of nested iterables (lists, tuples, generators,
+    ...), at any depth, in order. Strings, bytes and dicts count as single
+    items. Walks with a stack of iterators rather than recursion, and stops
+    pulling from them as soon as the reduction is done."""
+    return _Flatten(step)
+flatten.stage = ("flatten",)
+
+class _Take(Transducer):
+    __slots__ = ("n",)
+    def __init__(self, rf, n):
+        Transducer.__init__(self, rf)
+        self.n = n
+
+    def step(self, r, x):
+        n = self.n
+        self.n = n - 1
+        r = self.rf_step(r, x) if n > 0 else r
+        return ensure_reduced(r) if n <= 1 else r
+
+    def step_many(self, r, xs):
+        n = self.n
+        if not xs or not isinstance(n, int):
+            return Transducer.step_many(self, r, xs)
+        self.n = n - len(xs)
+        if n > len(xs):
+            return self.rf_step_many(r, xs)
+        return ensure_reduced(self.rf_step_many(r, xs[:n]) if n > 0 else r)
+
 def take(n):
     """Takes n values from a collection."""
     def _take_xducer(step):
-        outer_vars = {"counter": n}
-        def _take_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            n = outer_vars["counter"]
-            outer_vars["counter"] -= 1
-            r = step(r, x) if n > 0 else r
-            return ensure_reduced(r) if outer_vars["counter"] <= 0 else r
-        return _take_step
-    return _take_xducer
+        return _Take(step, n)
+    return _stage(_take_xducer, take, n)
+
+class _TakeWhile(Transducer):
+    __slots__ = ("pred",)
+    def __init__(self, rf, pred):
+        Transducer.__init__(self, rf)
+        self.pred = pred
+
+    def step(self, r, x):
+        return self.rf_step(r, x) if self.pred(x) else Reduced(r)
+
+    def step_many(self, r, xs):
+        taken = list(itertools.takewhile(self.pred, xs))
+        if taken:
+            r = self.rf_step_many(r, taken)
+        if len(taken) == len(xs) or isinstance(r, Reduced):
+            return r
+        return Reduced(r)
 
 def take_while(pred):
     """Takes while a condition is true. Note that take_while will take the
     first input that tests false, so be mindful of mutable input sources."""
     def _take_while_xducer(step):
-        def _take_while_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            return step(r, x) if pred(x) else Reduced(r)
-        return _take_while_step
-    return _take_while_xducer
+        return _TakeWhile(step, pred)
+    return _stage(_take_while_xducer, take_while, pred)
+
+class _Drop(Transducer):
+    __slots__ = ("n",)
+    short_circuits = False
+    def __init__(self, rf, n):
+        Transducer.__init__(self, rf)
+        self.n = n
+
+    def step(self, r, x):
+        if self.n > 0:
+            self.n -= 1
+            return r
+        return self.rf_step(r, x)
+
+    def step_many(self, r, xs):
+        n = self.n
+        if n > 0:
+            if not isinstance(n, int):
+                return Transducer.step_many(self, r, xs)
+            self.n = max(n - len(xs), 0)
+            xs = xs[n:]
+        return self.rf_step_many(r, xs) if xs else r
 
 def drop(n):
     """Drops n items from beginning of input sequence."""
     def _drop_xducer(step):
-        outer = {"count": 0}
-        def _drop_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            if outer["count"] < n:
-                outer["count"] += 1
+        return _Drop(step, n)
+    return _stage(_drop_xducer, drop, n)
+
+class _DropWhile(Transducer):
+    __slots__ = ("pred", "dropping")
+    short_circuits = False
+    def __init__(self, rf, pred):
+        Transducer.__init__(self, rf)
+        self.pred = pred
+        self.dropping = True
+
+    def step(self, r, x):
+        if self.dropping:
+            if self.pred(x):
                 return r
-            else:
-                return step(r, x)
-        return _drop_step
-    return _drop_xducer
+            self.dropping = False
+        return self.rf_step(r, x)
+
+    def step_many(self, r, xs):
+        if self.dropping:
+            xs = list(itertools.dropwhile(self.pred, xs))
+            if not xs:
+                return r
+            self.dropping = False
+        return self.rf_step_many(r, xs)
 
 def drop_while(pred):
     """Drops values so long as a condition is true."""
     def _drop_while_xducer(step):
-        outer = {"trigger": False}
-        def _drop_while_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            if outer["trigger"]:
-                return step(r, x)
-            elif not pred(x):
-                outer["trigger"] = True
-                return step(r, x)
-            return r
-        return _drop_while_step
-    return _drop_while_xducer
+        return _DropWhile(step, pred)
+    return _stage(_drop_while_xducer, drop_while, pred)
+
+class _TakeNth(Transducer):
+    __slots__ = ("n", "idx")
+    short_circuits = False
+    def __init__(self, rf, n):
+        Transducer.__init__(self, rf)
+        self.n = n
+        self.idx = 0
+
+    def step(self, r, x):
+        idx = self.idx
+        self.idx = idx + 1
+        return r if idx % self.n else self.rf_step(r, x)
+
+    def step_many(self, r, xs):
+        idx, n = self.idx, self.n
+        if not _positive_int(n):
+            return Transducer.step_many(self, r, xs)
+        self.idx = idx + len(xs)
+        xs = xs[-idx % n::n]
+        return self.rf_step_many(r, xs) if xs else r
 
 def take_nth(n):
     """Takes every nth item from input values."""
     def _take_nth_xducer(step):
-        outer = {"idx": 0}
-        def _take_nth_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            if outer["idx"] % n:
-                outer["idx"] += 1
-                return r
-            else:
-                outer["idx"] += 1
-                return step(r, x)
-        return _take_nth_step
-    return _take_nth_xducer
+        return _TakeNth(step, n)
+    return _stage(_take_nth_xducer, take_nth, n)
+
+class _Replace(Transducer):
+    __slots__ = ("smap",)
+    short_circuits = False
+    def __init__(self, rf, smap):
+        Transducer.__init__(self, rf)
+        self.smap = smap
+
+    def step(self, r, x):
+        smap = self.smap
+        return self.rf_step(r, smap[x] if x in smap else x)
+
+    def step_many(self, r, xs):
+        smap = self.smap
+        return self.rf_step_many(r, [smap[x] if x in smap else x for x in xs])
 
 def replace(smap):
     """Replaces keys in smap with corresponding values."""
     def _replace_xducer(step):
-        def _replace_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            if x in smap:
-                return step(r, smap[x])
-            else:
-                return step(r, x)
-        return _replace_step
-    return _replace_xducer
+        return _Replace(step, smap)
+    return _stage(_replace_xducer, replace, smap)
+
+class _Keep(Transducer):
+    __slots__ = ("pred",)
+    short_circuits = False
+    def __init__(self, rf, pred):
+        Transducer.__init__(self, rf)
+        self.pred = pred
+
+    def step(self, r, x):
+        res = self.pred(x)
+        return self.rf_step(r, res) if res is not None else r
+
+    def step_many(self, r, xs):
+        xs = [y for y in builtins.map(self.pred, xs) if y is not None]
+        return self.rf_step_many(r, xs) if xs else r
 
 def keep(pred):
     """Keep pred items for which pred does not return None."""
     def _keep_xducer(step):
-        def _keep_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            res = pred(x)
-            return step(r, res) if res is not None else r
-        return _keep_step
-    return _keep_xducer
+        return _Keep(step, pred)
+    return _stage(_keep_xducer, keep, pred)
+
+class _Remove(Transducer):
+    __slots__ = ("pred",)
+    short_circuits = False
+    def __init__(self, rf, pred):
+        Transducer.__init__(self, rf)
+        self.pred = pred
+
+    def step(self, r, x):
+        return r if self.pred(x) else self.rf_step(r, x)
+
+    def step_many(self, r, xs):
+        xs = list(itertools.filterfalse(self.pred, xs))
+        return self.rf_step_many(r, xs) if xs else r
 
 def remove(pred):
     """Remove anything that satisfies pred."""
     def _remove_xducer(step):
-        def _remove_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            return step(r, x) if not pred(x) else r
-        return _remove_step
-    return _remove_xducer
+        return _Remove(step, pred)
+    return _stage(_remove_xducer, remove, pred)
+
+class _KeepIndexed(Transducer):
+    __slots__ = ("f", "idx")
+    short_circuits = False
+    def __init__(self, rf, f):
+        Transducer.__init__(self, rf)
+        self.f = f
+        self.idx = 0
+
+    def step(self, r, x):
+        idx = self.idx
+        self.idx = idx + 1
+        res = self.f(idx, x)
+        return self.rf_step(r, res) if res is not None else r
+
+    def step_many(self, r, xs):
+        idx = self.idx
+        self.idx = idx + len(xs)
+        xs = [y for y in itertools.starmap(self.f, enumerate(xs, idx))
+              if y is not None]
+        return self.rf_step_many(r, xs) if xs else r
 
 def keep_indexed(f):
     """Keep values where f does not return None. f for keep indexed is a
     function that takes both index and value as inputs."""
     def _keep_indexed_xducer(step):
-        outer = {"idx": 0}
-        def _keep_indexed_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            res = f(outer["idx"], x)
-            outer["idx"] += 1
-            return step(r, res) if res is not None else r
-        return _keep_indexed_step
-    return _keep_indexed_xducer
+        return _KeepIndexed(step, f)
+    return _stage(_keep_indexed_xducer, keep_indexed, f)
+
+class _Dedupe(Transducer):
+    __slots__ = ("prev",)
+    short_circuits = False
+    def __init__(self, rf):
+        Transducer.__init__(self, rf)
+        self.prev = Missing
+
+    def step(self, r, x):
+        prev = self.prev
+        if prev is Missing or x != prev:
+            self.prev = x
+            return self.rf_step(r, x)
+        return r
 
 def dedupe(step):
     """Removes duplicatees that occur in order. Accepts first inputs through
     and drops subsequent duplicates."""
-    outer = {}
-    def _dedupe_step(r=Missing, x=Missing):
-        if r is Missing: return step()
-        if x is Missing:
-            return step(r)
-        if "prev" not in outer:
-            outer["prev"] = x
-            return step(r, x)
-        elif x != outer["prev"]:
-            outer["prev"] = x
-            return step(r, x)
-        else:
+    return _Dedupe(step)
+dedupe.stage = ("dedupe",)
+
+def _hand_off(temp, tuples):
+    """Emits the finished buffer temp itself, its owner having started a new
+    one, or a tuple of its items."""
+    return tuple(temp) if tuples else temp
+
+class _PartitionBy(Transducer):
+    __slots__ = ("pred", "tuples", "last", "temp")
+    short_circuits = False
+    def __init__(self, rf, pred, tuples):
+        Transducer.__init__(self, rf)
+        self.pred = pred
+        self.tuples = tuples
+        self.last = Missing
+        self.temp = []
+
+    def step(self, r, x):
+        past_val = self.last
+        present_val = self.pred(x)
+        self.last = present_val
+        if past_val is Missing or present_val == past_val:
+            self.temp.append(x)
             return r
-    return _dedupe_step
+        temp, self.temp = self.temp, []
+        ret = self.rf_step(r, _hand_off(temp, self.tuples))
+        if not isinstance(ret, Reduced):
+            self.temp.append(x)
+        return ret
+
+    def complete(self, r):
+        if self.temp:
+            temp, self.temp = self.temp, []
+            r = unreduced(self.rf_step(r, _hand_off(temp, self.tuples)))
+        return self.rf.complete(r)
 
-def partition_by(pred):
+def partition_by(pred, tuples=False):
     """Split inputs into lists by starting a new list each time the predicate
     passed in evaluates to a different condition (true/false) than what holds
-    for the present list."""
+    for the present list. Emits tuples instead with tuples=True."""
     def _partition_by_xducer(step):
+        return _PartitionBy(step, pred, tuples)
+    args = (pred, True) if tuples else (pred,)
+    return _stage(_partition_by_xducer, partition_by, *args)
 
-        outer = {"last": Missing,
-                 "temp": []}
+class _PartitionAll(Transducer):
+    __slots__ = ("n", "tuples", "temp")
+    short_circuits = False
+    def __init__(self, rf, n, tuples):
+        Transducer.__init__(self, rf)
+        self.n = n
+        self.tuples = tuples
+        self.temp = []
 
-        def _partition_by_step(r=Missing, x=Missing):
-            if r is Missing: return step()
+    def step(self, r, x):
+        temp = self.temp
+        temp.append(x)
+        if len(temp) == self.n:
+            self.temp = []
+            return self.rf_step(r, _hand_off(temp, self.tuples))
+        return r
 
-            # arity 1 - called on completion. 
-            if x is Missing:
-                if not outer["temp"]:
-                    return r
-                _temp = outer["temp"][:]
-                del outer["temp"][:]
-                _r =  unreduced(step(r, _temp))
-                return step(_r)
-
-            # arity 2 - normal step.
-            past_val = outer["last"]
-            present_val = pred(x)
-            outer["last"] = present_val
-            if past_val is Missing or present_val == past_val:
-                outer["temp"].append(x)
-                return r
-            else:
-                _temp = outer["temp"][:]
-                del outer["temp"][:]
-                ret = step(r, _temp)
-                if not isinstance(ret, Reduced):
-                    outer["temp"].append(x)
-                return ret
-
-        return _partition_by_step
-    return _partition_by_xducer
-
-def partition_all(n):
-    """Splits inputs into lists of size n."""
+    def step_many(self, r, xs):
+        temp, n = self.temp, self.n
+        if not _positive_int(n):
+            return Transducer.step_many(self, r, xs)
+        temp.extend(xs)
+        full = len(temp) - len(temp) % n
+        if not full:
+            return r
+        if self.tuples:
+            parts = list(builtins.zip(*[iter(temp[:full])] * n))
+        else:
+            parts = [temp[i:i + n] for i in range(0, full, n)]
+        del temp[:full]
+        ret = self.rf_step_many(r, parts)
+        if isinstance(ret, Reduced):
+            # one at a time, nothing past the partition downstream stopped
+            # at would have been stepped.
+            del temp[:]
+        return ret
+
+    def complete(self, r):
+        if self.temp:
+            temp, self.temp = self.temp, []
+            r = unreduced(self.rf_step(r, _hand_off(temp, self.tuples)))
+        return self.rf.complete(r)
+
+def partition_all(n, tuples=False):
+    """Splits inputs into lists of size n (the last one may be shorter).
+    Emits tuples instead with tuples=True."""
     def _partition_all_xducer(step):
-        outer = {"temp": []}
+        return _PartitionAll(step, n, tuples)
+    args = (n, True) if tuples else (n,)
+    return _stage(_partition_all_xducer, partition_all, *args)
 
-        def _partition_all_step(r=Missing, x=Missing):
-            if r is Missing: return step()
+class _Partition(Transducer):
+    __slots__ = ("n", "step_by", "emit", "window", "seen")
+    short_circuits = False
+    def __init__(self, rf, n, step_by, emit):
+        Transducer.__init__(self, rf)
+        self.n = n
+        self.step_by = step_by
+        self.emit = emit
+        self.window = deque(maxlen=n)
+        self.seen = 0
 
-            # arity 1: called on completion.
-            if x is Missing:
-                if not outer["temp"]:
-                    return r
-                _temp = outer["temp"][:]
-                del outer["temp"][:]
-                _r =  unreduced(step(r, _temp))
-                return step(_r)
-
-            # arity 2: called w/each reduction step.
-            outer["temp"].append(x)
-            if len(outer["temp"]) == n:
-                _temp = outer["temp"][:]
-                del outer["temp"][:]
-                return step(r, _temp)
+    def step(self, r, x):
+        window = self.window
+        window.append(x)
+        seen = self.seen = self.seen + 1
+        if seen < self.n or (seen - self.n) % self.step_by:
             return r
+        return self.rf_step(r, self.emit(window))
 
-        return _partition_all_step
-    return _partition_all_xducer
+def _identity(x):
+    return x
+
+def partition(n, step=None, tuples=False, view=False):
+    """Splits inputs into windows of n items, starting a new window every
+    step items (n by default, giving partitions side by side). Items left
+    over at the end that do not fill a window are dropped. Windows are lists,
+    or tuples with tuples=True.
+
+    The window is kept in a deque of n items. With view=True that deque is
+    emitted as is instead of a copy: it changes on the next step, so read it
+    there and then, and never modify it."""
+    step = n if step is None else step
+    if not (_positive_int(n) and _positive_int(step)):
+        raise ValueError("partition needs positive integers for n and step.")
+    emit = _identity if view else tuple if tuples else list
+    def _partition_xducer(rf):
+        return _Partition(rf, n, step, emit)
+    return _stage(_partition_xducer, partition, n, step, tuples, view)
+
+def sliding(n, tuples=False, view=False):
+    """Overlapping windows of n consecutive items, one per item from the nth
+    on; partition(n, 1)."""
+    return partition(n, 1, tuples, view)
+
+class _RandomSample(Transducer):
+    __slots__ = ("prob",)
+    short_circuits = False
+    def __init__(self, rf, prob):
+        Transducer.__init__(self, rf)
+        self.prob = prob
+
+    def step(self, r, x):
+        return self.rf_step(r, x) if random() < self.prob else r
+
+    def step_many(self, r, xs):
+        prob = self.prob
+        xs = [x for x in xs if random() < prob]
+        return self.rf_step_many(r, xs) if xs else r
 
 def random_sample(prob):
     """Has prob probability of returning each input it receives."""
     def _random_sample_xducer(step):
-        def _random_sample_step(r=Missing, x=Missing):
-            if r is Missing: return step()
-            if x is Missing:
-                return step(r)
-            return step(r, x) if random() < prob else r
-        return _random_sample_step
-    return _random_sample_xducer
+        return _RandomSample(step, prob)
+    return _stage(_random_sample_xducer, random_sample, prob)
 
 
 def append(r=Missing, x=Missing):
@@ -353,12 +1162,153 @@ def append(r=Missing, x=Missing):
     if x is Missing: return r
     r.append(x)
     return r
+append.short_circuits = False
+
+def _append_many(r, xs):
+    r.extend(xs)
+    return r
+append.step_many = _append_many
+
+def _add(r=Missing, x=Missing):
+    """Reducing function adding items to a set."""
+    if r is Missing: return set()
+    if x is Missing: return r
+    r.add(x)
+    return r
+_add.short_circuits = False
+
+def _assoc(r=Missing, x=Missing):
+    """Reducing function storing (key, value) items in a dict."""
+    if r is Missing: return {}
+    if x is Missing: return r
+    r[x[0]] = x[1]
+    return r
+_assoc.short_circuits = False
+
+def _join(r=Missing, x=Missing):
+    """Reducing function collecting strings in a list, joined on completion."""
+    if r is Missing: return []
+    if x is Missing: return "".join(r)
+    r.append(x)
+    return r
+_join.short_circuits = False
+
+def _extend(r, items):
+    r.extend(items)
+    return r
+
+def _update(r, items):
+    r.update(items)
+    return r
+
+@functools.singledispatch
+def collector(target):
+    """Tells into how to fill target. Returns (rf, start, extend): the reducing
+    function and initial value to transduce with, and extend(start, items)
+    adding an iterable of items in bulk (or None if there is no such thing).
+    Register more types with collector.register; anything else is filled
+    with append. numpy arrays are supported without importing numpy here."""
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(target, numpy.ndarray):
+        collector.register(numpy.ndarray, _collect_ndarray)
+        return _collect_ndarray(target)
+    return append, target, _extend if hasattr(target, "extend") else None
+
+@collector.register(list)
+@collector.register(deque)
+@collector.register(bytearray)
+@collector.register(array.array)
+def _collect_appending(target):
+    return append, target, _extend
+
+@collector.register(set)
+def _collect_set(target):
+    return _add, target, _update
+
+@collector.register(dict)
+def _collect_dict(target):
+    return _assoc, target, _update
+
+@collector.register(str)
+def _collect_str(target):
+    return _join, [target], _extend
+
+def _collect_ndarray(target):
+    """A 1-d numpy array target gives a new array with the items added on.
+    Bulk extends read them with numpy.fromiter, sized when the count is
+    exact."""
+    numpy = sys.modules["numpy"]
+    def concatenate(r=Missing, x=Missing):
+        if r is Missing: return [target]
+        if x is Missing:
+            if len(r) == 1: return r[0]
+            return numpy.concatenate((r[0], numpy.array(r[1:], r[0].dtype)))
+        r.append(x)
+        return r
+    concatenate.short_circuits = False
+    def extend(r, items):
+        count = items.n if isinstance(items, _Sized) else -1
+        r[0] = numpy.concatenate((r[0], numpy.fromiter(items, r[0].dtype,
+                                                       count)))
+        return r
+    return concatenate, [target], extend
+
+def into(target, xducer, coll, engine="reduce", batch_size=None):
+    """Transduces items from coll into target, as collector(target) says: lists,
+    deques, bytearrays and arrays are appended to, sets added to, dicts take
+    (key, value) items and a str target gives a new string with the items
+    joined on. When every stage has an itertools equivalent (see transduce)
+    the items are added with one bulk extend or update. batch_size is passed
+    on to transduce otherwise."""
+    rf, start, extend = collector(target)
+    if extend is not None and not _reduces_itself(coll):
+        xducer, coll = _push_down(xducer, coll)
+        lowered = _lower(xducer, coll)
+        if lowered is not None:
+            return rf(extend(start, _sized(lowered, xducer, coll)))
+    return transduce(xducer, rf, start, coll, engine, batch_size)
+
+class Eduction(object):
+    """A lazy, re-iterable application of a transducer to a collection. Each
+    iteration pulls items from coll only as needed: every item is stepped
+    into a small buffer, whatever that produced is yielded, and the buffer is
+    emptied again. Stops pulling once the transducer returns Reduced, and
+    yields whatever completion flushes (e.g., the last partition_all chunk).
+    An iterator it got from coll (a generator reading a file, say) is closed
+    as soon as it stops pulling, or when the iteration is abandoned."""
+    def __init__(self, xform, coll):
+        self.xform = xform
+        self.coll = coll
+
+    def __transduce_reduce__(self, rf, init):
+        """Reduces through xform straight into rf, without a buffer. xform's
+        own completion (flushing partitions, say) steps into rf, but rf is
+        left for the caller to complete."""
+        return transduce(self.xform, _Completing(rf), init, self.coll)
 
-def into(target, xducer, coll):
-    """Transduces items from coll into target.
-    :TODO: Write improved dispatch for collections?"""
-    return transduce(xducer, append, target, coll)
+    def __iter__(self):
+        buf = []
+        reducer = _as_reducer(self.xform(append))
+        step = reducer.step
+        it = iter(self.coll)
+        try:
+            for x in it:
+                ret = step(buf, x)
+                if buf:
+                    for y in buf:
+                        yield y
+                    del buf[:]
+                if isinstance(ret, Reduced):
+                    break
+        finally:
+            close = getattr(it, "close", None)
+            if it is not self.coll and close is not None:
+                close()
+        reducer.complete(buf)
+        for y in buf:
+            yield y
 
 def eduction(xf, coll):
-    """Return a generator with transform applied. Not implemented."""
-    raise NotImplementedError
+    """Return an iterable with transform applied, computed lazily on each
+    iteration. See Eduction."""
+    return Eduction(xf, coll)
@@ -0,0 +1,248 @@
+# Copyright 2014 Cognitect. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+NumPy versions of the stateless and counting transducers. Instead of single
+items they step over blocks, 1-d arrays of items (2-d arrays of rows after
+partition_all), calling ufuncs or other vectorised functions once per block:
+
+    >>> from transducers import compose, vectorized as V
+    >>> V.into(numpy.empty(0, int),
+    ...        compose(V.map(numpy.square), V.filter(lambda x: x % 2),
+    ...                V.take(1000)),
+    ...        numpy.arange(10 ** 7))
+
+The items produced are the same as with the scalar transducers of the same
+name; take stops pulling blocks once it has enough. These stages only work
+with transduce and into from this module, and compose with each other (or
+with transducers written for blocks). numpy is only imported if available,
+and needed once something is transduced.
+"""
+import builtins
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .transducers import Transducer, append, collector, ensure_reduced, \
+                         reduce, unreduced, _as_reducer, _Stage
+
+__all__ = ["map", "filter", "remove", "take", "drop", "take_nth", "replace",
+           "partition_all", "transduce", "into"]
+
+def _numpy():
+    if numpy is None:
+        raise ImportError("transducers.vectorized requires numpy.")
+    return numpy
+
+def _stage(xducer, factory, *args):
+    """Like the built-ins' stages, with kinds of their own (vectorized.map,
+    ...) so they are never mistaken for the scalar ones."""
+    return _Stage(xducer, ("vectorized." + factory.__name__,) + args, factory)
+
+class _Map(Transducer):
+    __slots__ = ("f",)
+    short_circuits = False
+    def __init__(self, rf, f):
+        Transducer.__init__(self, rf)
+        self.f = f
+
+    def step(self, r, block):
+        return self.rf_step(r, numpy.asarray(self.f(block)))
+
+def map(f):
+    """Applies the vectorised function f (e.g. a ufunc) to each block."""
+    def _map_xducer(step):
+        return _Map(step, f)
+    return _stage(_map_xducer, map, f)
+
+class _Filter(Transducer):
+    __slots__ = ("pred", "keep")
+    short_circuits = False
+    def __init__(self, rf, pred, keep):
+        Transducer.__init__(self, rf)
+        self.pred = pred
+        self.keep = keep
+
+    def step(self, r, block):
+        mask = numpy.asarray(self.pred(block), dtype=bool)
+        block = block[mask if self.keep else ~mask]
+        return self.rf_step(r, block) if len(block) else r
+
+def filter(pred):
+    """Keeps the items for which the vectorised pred is true."""
+    def _filter_xducer(step):
+        return _Filter(step, pred, True)
+    return _stage(_filter_xducer, filter, pred)
+
+def remove(pred):
+    """Drops the items for which the vectorised pred is true."""
+    def _remove_xducer(step):
+        return _Filter(step, pred, False)
+    return _stage(_remove_xducer, remove, pred)
+
+class _Take(Transducer):
+    __slots__ = ("n",)
+    def __init__(self, rf, n):
+        Transducer.__init__(self, rf)
+        self.n = n
+
+    def step(self, r, block):
+        n = self.n
+        block = block[:max(n, 0)]
+        self.n = n - len(block)
+        if len(block):
+            r = self.rf_step(r, block)
+        return ensure_reduced(r) if self.n <= 0 else r
+
+def take(n):
+    """Takes the first n items, then stops the reduction."""
+    def _take_xducer(step):
+        return _Take(step, n)
+    return _stage(_take_xducer, take, n)
+
+class _Drop(Transducer):
+    __slots__ = ("n",)
+    short_circuits = False
+    def __init__(self, rf, n):
+        Transducer.__init__(self, rf)
+        self.n = n
+
+    def step(self, r, block):
+        n = self.n
+        if n > 0:
+            self.n = n - len(block)
+            block = block[n:]
+        return self.rf_step(r, block) if len(block) else r
+
+def drop(n):
+    """Drops the first n items."""
+    def _drop_xducer(step):
+        return _Drop(step, n)
+    return _stage(_drop_xducer, drop, n)
+
+class _TakeNth(Transducer):
+    __slots__ = ("n", "idx")
+    short_circuits = False
+    def __init__(self, rf, n):
+        Transducer.__init__(self, rf)
+        self.n = n
+        self.idx = 0
+
+    def step(self, r, block):
+        start = -self.idx % self.n
+        self.idx += len(block)
+        block = block[start::self.n]
+        return self.rf_step(r, block) if len(block) else r
+
+def take_nth(n):
+    """Takes every nth item, counting across blocks."""
+    def _take_nth_xducer(step):
+        return _TakeNth(step, n)
+    return _stage(_take_nth_xducer, take_nth, n)
+
+class _Replace(Transducer):
+    __slots__ = ("smap",)
+    short_circuits = False
+    def __init__(self, rf, smap):
+        Transducer.__init__(self, rf)
+        self.smap = smap
+
+    def step(self, r, block):
+        out = block
+        for k, v in self.smap.items():
+            mask = block == k
+            if mask.any():
+                if out is block:
+                    out = block.copy()
+                out[mask] = v
+        return self.rf_step(r, out)
+
+def replace(smap):
+    """Replaces the items equal to a key of the dict smap with its value.
+    Values must fit the blocks' dtype."""
+    def _replace_xducer(step):
+        return _Replace(step, smap)
+    return _stage(_replace_xducer, replace, smap)
+
+class _PartitionAll(Transducer):
+    __slots__ = ("n", "rest")
+    short_circuits = False
+    def __init__(self, rf, n):
+        Transducer.__init__(self, rf)
+        self.n = n
+        self.rest = None
+
+    def step(self, r, block):
+        if self.rest is not None:
+            block = numpy.concatenate((self.rest, block))
+        full = len(block) - len(block) % self.n
+        self.rest = block[full:].copy() if full < len(block) else None
+        if full:
+            return self.rf_step(r, block[:full].reshape(-1, self.n))
+        return r
+
+    def complete(self, r):
+        if self.rest is not None:
+            rest, self.rest = self.rest, None
+            r = unreduced(self.rf_step(r, rest.reshape(1, -1)))
+        return self.rf.complete(r)
+
+def partition_all(n):
+    """Groups items into rows of n, giving 2-d blocks. The last, shorter row
+    (if any) comes on completion as a block of its own."""
+    def _partition_all_xducer(step):
+        return _PartitionAll(step, n)
+    return _stage(_partition_all_xducer, partition_all, n)
+
+def _blocks(coll, block_size):
+    """Views of block_size items of an array (or anything with a length that
+    numpy.asarray takes); other iterables are taken to yield blocks already."""
+    np = _numpy()
+    if not isinstance(coll, np.ndarray) and not hasattr(coll, "__len__"):
+        return builtins.map(np.asarray, coll)
+    coll = np.asarray(coll)
+    return (coll[i:i + block_size] for i in range(0, len(coll), block_size))
+
+def transduce(xform, f, start, coll, block_size=65536):
+    """Transduces the blocks of coll (see into) with xform, reducing them with
+    f, which is handed blocks."""
+    reducer = _as_reducer(xform(f))
+    return reducer.complete(reduce(reducer, _blocks(coll, block_size), start))
+
+def into(target, xform, coll, block_size=65536):
+    """Transduces coll into target. coll is an array (or something with a
+    length numpy.asarray takes), cut into views of block_size items, or an
+    iterable of blocks. An ndarray target gives a new array with the results
+    concatenated on, so their items must have the shape of its rows (e.g.
+    (n,) after partition_all(n), which also needs the item count to be a
+    multiple of n); other targets are filled with the result items as the
+    scalar into would."""
+    np = _numpy()
+    blocks = transduce(xform, append, [], coll, block_size)
+    if isinstance(target, np.ndarray):
+        shape = target.shape[1:]
+        for block in blocks:
+            if block.shape[1:] != shape:
+                raise ValueError(
+                    "Items of shape %r do not fit an ndarray target with "
+                    "rows of shape %r (a short last partition_all row?); "
+                    "into a list instead." % (block.shape[1:], shape))
+        return np.concatenate([target] + blocks)
+    rf, start, extend = collector(target)
+    items = itertools.chain.from_iterable(blocks)
+    if extend is not None:
+        return rf(extend(start, items))
+    return rf(reduce(rf, items, start))